@@ -1,33 +1,1668 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-# import re
+import re
 import random
 import sys
 import os
+import csv
+import json
 import time
+import sqlite3
+import asyncio
+import itertools
+import threading
 import traceback
+import functools
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
 # from tkinter.filedialog import dialogstates
 
 import pandas as pd
 from datetime import datetime
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QPushButton, QTextEdit, QLabel, QMessageBox, QDialog,
-    QHBoxLayout, QLineEdit, QComboBox, QFileDialog, QTableWidget, QTableWidgetItem, QHeaderView,QScrollArea
+    QHBoxLayout, QLineEdit, QComboBox, QFileDialog, QTableWidget, QTableWidgetItem, QHeaderView,QScrollArea,
+    QCheckBox, QSpinBox, QProgressBar, QTableView, QStyledItemDelegate, QStyleOptionButton, QStyle
 )
 # from PyQt5.QtCore import Qt, QThread, pyqtSignal
 # from numpy.ma.core import minimum
-from playwright.sync_api import sync_playwright
+from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import async_playwright, Error as PlaywrightAsyncError, \
+    TimeoutError as PlaywrightAsyncTimeoutError
 from PyQt5.QtGui import QClipboard
-from PyQt5.QtCore import Qt, QUrl
+from PyQt5.QtCore import Qt, QUrl, QObject, QTimer, pyqtSignal, QAbstractTableModel, QModelIndex, QEvent, \
+    QSortFilterProxyModel
 from PyQt5.QtGui import QColor, QFont,  QDesktopServices,  QDoubleValidator
 # from PyQt5.QtWidgets import QDesktopServices
 import os
-import gspread
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from resource_blocking import is_blocked_request
+from product_files import (
+    normalize_product_names, build_product_url_index, lookup_product_urls, replace_file_atomically,
+    product_file_key, write_product_rows,
+)
+# gspread、Google API 用戶端、pyarrow 載入較慢，改在第一次使用時才 import，讓主視窗先顯示
+
+
+@functools.lru_cache(maxsize=None)
+def load_pyarrow():
+    """載入 pyarrow（含 dataset、parquet）；未安裝時回傳 None，停用 Parquet 快照，其餘功能照常"""
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+# ===============================
+# 表格資料擷取
+# ===============================
+# 在瀏覽器端一次取出所有列、所有儲存格的文字，取代逐列 locator 的 IPC 往返
+TABLE_ROWS_JS = "rows => rows.map(row => Array.from(row.querySelectorAll('td'), td => td.innerText))"
+
+
+async def extract_table_rows(page, selector="table tbody tr"):
+    """以單次 eval_on_selector_all 取出整個表格，回傳每列儲存格文字的 list（背景抓取核心共用）"""
+    return await page.eval_on_selector_all(selector, TABLE_ROWS_JS)
+
+
+# ===============================
+# 快速抓取模式：無頭瀏覽器 + 阻擋非必要資源
+# ===============================
+def block_heavy_resources(context):
+    """在 context 上掛載請求路由，丟棄抓表格用不到的資源"""
+    def handle_route(route):
+        if is_blocked_request(route.request):
+            route.abort()
+        else:
+            route.continue_()
+    context.route("**/*", handle_route)
+
+
+# ===============================
+# 登入狀態保存（storage_state，存於各使用者目錄下）
+# ===============================
+SELLER_LOGIN_URL = "https://goshophsn.com/users/login"
+SELLER_STATE_FILE = "goshophsn_state.json"
+BUYER_ACCOUNT_URL = "https://baibaoshop.com/my-account/"
+BUYER_STATE_FILE = "baibaoshop_state.json"
+BUYER_CART_URL = "https://baibaoshop.com/cart/"
+
+
+def is_seller_session_valid(page):
+    """賣家後台未登入時會被導回 /users/login"""
+    return "/users/login" not in page.url
+
+
+def is_buyer_session_valid(page):
+    """百寶倉「我的帳號」頁面仍顯示登入表單代表未登入"""
+    return page.locator('input[name="username"]').count() == 0
+
+
+def load_storage_state(state_file):
+    """回傳可傳給 new_context(storage_state=...) 的路徑，檔案不存在則回傳 None"""
+    return state_file if state_file and os.path.exists(state_file) else None
+
+
+def discard_storage_state(state_file):
+    if state_file and os.path.exists(state_file):
+        os.remove(state_file)
+
+
+# ===============================
+# 瀏覽器引擎：整個程式共用一個 Playwright 與瀏覽器
+# ===============================
+SITE_SELLER = "seller"  # goshophsn.com 賣家後台
+SITE_BUYER = "buyer"    # baibaoshop.com 百寶倉
+
+
+class BrowserEngine:
+    """
+    持有單一 Playwright 實例，瀏覽器依有頭/無頭各啟動一次，
+    context 依 (使用者, 網站, 是否無頭) 快取，頁面借出後歸還重複使用。
+    冷啟動成本只在程式執行期間付一次，而非每次按下按鈕。
+    """
+
+    def __init__(self, channel="msedge"):
+        self.channel = channel
+        self.playwright = None
+        self.browsers = {}    # headless -> Browser
+        self.contexts = {}    # (user, site, headless) -> BrowserContext
+        self.idle_pages = {}  # (user, site, headless) -> [Page]
+
+    def get_browser(self, headless=False):
+        if self.playwright is None:
+            self.playwright = sync_playwright().start()
+        browser = self.browsers.get(headless)
+        if browser is None or not browser.is_connected():
+            browser = self.playwright.chromium.launch(channel=self.channel, headless=headless)
+            self.browsers[headless] = browser
+        return browser
+
+    def has_context(self, user, site, headless=False):
+        return (user, site, headless) in self.contexts
+
+    def get_context(self, user, site, headless=False, storage_state=None, block_resources=False):
+        """取得快取的 context；第一次建立時才套用 storage_state 與資源阻擋"""
+        key = (user, site, headless)
+        context = self.contexts.get(key)
+        if context is not None and not (context.browser and context.browser.is_connected()):
+            # 使用者手動關掉瀏覽器視窗，舊的 context 已失效
+            self.idle_pages.pop(key, None)
+            context = None
+        if context is None:
+            context = self.get_browser(headless).new_context(storage_state=storage_state)
+            if block_resources:
+                block_heavy_resources(context)
+            self.contexts[key] = context
+        return context
+
+    def acquire_page(self, user, site, headless=False, storage_state=None, block_resources=False):
+        """借出一個頁面：優先使用歸還過的頁面，沒有才開新分頁"""
+        key = (user, site, headless)
+        context = self.get_context(user, site, headless, storage_state, block_resources)
+        pages = self.idle_pages.get(key, [])
+        while pages:
+            page = pages.pop()
+            if not page.is_closed():
+                return page
+        return context.new_page()
+
+    def release_page(self, page):
+        """歸還頁面，供下次 acquire_page 重複使用"""
+        if page is None or page.is_closed():
+            return
+        for key, context in self.contexts.items():
+            if page.context is context:
+                self.idle_pages.setdefault(key, []).append(page)
+                return
+        page.close()
+
+    def close_context(self, user, site, headless=False):
+        key = (user, site, headless)
+        self.idle_pages.pop(key, None)
+        context = self.contexts.pop(key, None)
+        if context is not None:
+            context.close()
+
+    def shutdown(self):
+        """關閉所有 context、瀏覽器並停止 Playwright"""
+        self.idle_pages.clear()
+        for context in self.contexts.values():
+            try:
+                context.close()
+            except Exception:
+                pass
+        self.contexts.clear()
+        for browser in self.browsers.values():
+            try:
+                browser.close()
+            except Exception:
+                pass
+        self.browsers.clear()
+        if self.playwright is not None:
+            self.playwright.stop()
+            self.playwright = None
+
+
+# ===============================
+# 頁面就緒條件與導航耗時記錄（取代 networkidle）
+# ===============================
+# 每種頁面的就緒條件，可依網站調整：
+#   ("selector", css)      指定元素出現
+#   ("rows_changed", css)  翻頁後第一列內容與點擊前不同
+#   ("response", regex)    收到網址符合的回應
+#   ("load_state", state)  Playwright 的 load state（例如 "networkidle"）
+PAGE_READINESS = {
+    "seller_table": ("selector", "table tbody tr, input[type='email']"),  # 未登入會被導到登入頁
+    "seller_table_next": ("rows_changed", "table tbody tr"),
+    "buyer_account": ("selector", "input[name='username'], .woocommerce-MyAccount-content"),
+    "buyer_product": ("selector", "form.cart, body.error404"),
+    # 加入購物車後的成功／錯誤通知（一般送出會重新載入頁面，AJAX 加入則顯示彈出視窗）
+    "buyer_cart_added": ("selector", ".woocommerce-message, .woocommerce-error, .wd-popup-added_to_cart"),
+}
+READINESS_TIMEOUT = 15000  # 毫秒
+LATENCY_LOG_FILE = "navigation_latency.csv"
+
+ROW_CHANGED_JS = """([selector, before]) => {
+    const row = document.querySelector(selector);
+    return row !== null && row.innerText !== before;
+}"""
+
+
+class LatencyProfile:
+    """記錄每次導航的動作與等待耗時，寫入 navigation_latency.csv 並提供摘要"""
+
+    def __init__(self, log_file=LATENCY_LOG_FILE):
+        self.log_file = log_file
+        self.lock = threading.Lock()
+        self.records = []
+
+    def record(self, user, page_type, strategy, url, action_seconds, wait_seconds):
+        row = [datetime.now().strftime("%Y-%m-%d %H:%M:%S"), user, page_type, strategy, url,
+               round(action_seconds * 1000), round(wait_seconds * 1000)]
+        with self.lock:
+            self.records.append(row)
+            try:
+                new_file = not os.path.exists(self.log_file)
+                with open(self.log_file, "a", newline="", encoding="utf-8") as f:
+                    writer = csv.writer(f)
+                    if new_file:
+                        writer.writerow(["time", "user", "page_type", "strategy", "url", "action_ms", "wait_ms"])
+                    writer.writerow(row)
+            except OSError:
+                pass  # 記錄失敗不影響抓取
+
+    def summary(self):
+        """依頁面類型統計本次執行以來的平均耗時"""
+        with self.lock:
+            records = list(self.records)
+        totals = {}
+        for _, _, page_type, _, _, action_ms, wait_ms in records:
+            count, action_total, wait_total = totals.get(page_type, (0, 0, 0))
+            totals[page_type] = (count + 1, action_total + action_ms, wait_total + wait_ms)
+        return "；".join(
+            f"{page_type} {count} 次，動作平均 {action_total // count} ms，等待平均 {wait_total // count} ms"
+            for page_type, (count, action_total, wait_total) in totals.items()
+        )
+
+
+latency_profile = LatencyProfile()
+
+
+def navigate_sync(page, page_type, action, user=""):
+    """執行 action（goto 或 click）後依 PAGE_READINESS[page_type] 等待就緒，並記錄耗時"""
+    strategy, target = PAGE_READINESS[page_type]
+    start = time.perf_counter()
+    if strategy == "response":
+        with page.expect_response(lambda response: re.search(target, response.url),
+                                  timeout=READINESS_TIMEOUT) as response_info:
+            action()
+            acted = time.perf_counter()
+        response_info.value
+    else:
+        before = None
+        if strategy == "rows_changed" and page.query_selector(target):
+            before = page.eval_on_selector(target, "row => row.innerText")
+        action()
+        acted = time.perf_counter()
+        if strategy == "selector":
+            page.wait_for_selector(target, timeout=READINESS_TIMEOUT)
+        elif strategy == "rows_changed":
+            page.wait_for_function(ROW_CHANGED_JS, arg=[target, before], timeout=READINESS_TIMEOUT)
+        else:
+            page.wait_for_load_state(target, timeout=READINESS_TIMEOUT)
+    latency_profile.record(user, page_type, strategy, page.url, acted - start, time.perf_counter() - acted)
+
+
+async def navigate_async(page, page_type, action, user=""):
+    """navigate_sync 的 async_api 版本，action 為回傳 coroutine 的函數"""
+    strategy, target = PAGE_READINESS[page_type]
+    start = time.perf_counter()
+    if strategy == "response":
+        async with page.expect_response(lambda response: re.search(target, response.url),
+                                        timeout=READINESS_TIMEOUT) as response_info:
+            await action()
+            acted = time.perf_counter()
+        await response_info.value
+    else:
+        before = None
+        if strategy == "rows_changed" and await page.query_selector(target):
+            before = await page.eval_on_selector(target, "row => row.innerText")
+        await action()
+        acted = time.perf_counter()
+        if strategy == "selector":
+            await page.wait_for_selector(target, timeout=READINESS_TIMEOUT)
+        elif strategy == "rows_changed":
+            await page.wait_for_function(ROW_CHANGED_JS, arg=[target, before], timeout=READINESS_TIMEOUT)
+        else:
+            await page.wait_for_load_state(target, timeout=READINESS_TIMEOUT)
+    latency_profile.record(user, page_type, strategy, page.url, acted - start, time.perf_counter() - acted)
+
+
+# ===============================
+# 出貨商品頁預先載入（兩個分頁輪流使用）
+# ===============================
+# 導航排到下一輪事件迴圈才開始，evaluate 不必等待新頁面載入即可返回
+START_NAVIGATION_JS = "url => { setTimeout(() => { location.href = url; }, 0); }"
+
+
+def is_product_url(url):
+    return isinstance(url, str) and url.startswith(("http://", "https://"))
+
+
+class ProductPagePrefetcher:
+    """
+    出貨時操作員在前景分頁處理目前商品，下一個商品網址同時在背景分頁載入；
+    按「下一筆」時只需切換到已載入好的分頁。
+    """
+
+    def __init__(self, page, spare_page, user=""):
+        self.page = page
+        self.spare_page = spare_page
+        self.user = user
+        self.prefetched_url = None
+
+    def show(self, url):
+        """讓前景分頁顯示 url；回傳 False 表示前景分頁剛重新載入"""
+        if self.prefetched_url is not None and url == self.prefetched_url:
+            self.page, self.spare_page = self.spare_page, self.page
+            self.prefetched_url = None
+            # 分頁已在背景載入，通常不必再等待
+            navigate_sync(self.page, "buyer_product", self.page.bring_to_front, self.user)
+            return True
+        if url == self.page.url:
+            return True  # 同一商品的不同規格，停留在目前分頁
+        navigate_sync(self.page, "buyer_product",
+                      lambda: self.page.goto(url, wait_until="domcontentloaded"), self.user)
+        return False
+
+    def prefetch(self, url):
+        """在背景分頁開始載入下一個商品，不等待載入完成"""
+        if not is_product_url(url) or url == self.page.url or url == self.prefetched_url:
+            return
+        self.prefetched_url = None
+        try:
+            # 先清空背景分頁，避免切換時把上一個商品頁誤認為已就緒
+            self.spare_page.goto("about:blank")
+            self.spare_page.evaluate(START_NAVIGATION_JS, url)
+            self.prefetched_url = url
+        except Exception:
+            pass  # 預先載入失敗時，切換到該商品再正常載入
+
+
+# ===============================
+# 非同步抓取核心：獨立執行緒上的 asyncio 事件迴圈，透過 Qt signal 回報進度
+# ===============================
+SELLER_ORDERS_URL = "https://goshophsn.com/seller/orders"
+SELLER_PRODUCTS_URL = "https://goshophsn.com/seller/products"
+ORDER_COLUMNS = ["#", "Order Code", "Num. of Products", "Customer", "Amount", "Service charge",
+                 "Final price", "Delivery Status", "Payment Status", "Product Info", "Options"]
+PRODUCT_COLUMNS = ["#", "Thumbnail Image", "Name", "Category", "Current Qty",
+                   "Base Price", "Published", "Examine Status", "Options"]
+
+
+class SessionExpiredError(Exception):
+    """背景抓取時發現賣家後台登入狀態已失效"""
+
+
+def parse_money(value):
+    """"$1,234.50" 之類的金額文字轉成 float，無法解析時為 0.0；已是數字時原值轉型"""
+    try:
+        return float(str(value).replace("$", "").replace(",", ""))
+    except Exception:
+        return 0.0
+
+
+def parse_count(value):
+    """數量文字轉成 int，無法解析時為 0"""
+    try:
+        return int(value)
+    except Exception:
+        return 0
+
+
+def clean_order_row(row_data):
+    """去除空白並將金額、數量欄位轉成數字"""
+    cleaned_row_data = [cell.strip() for cell in row_data]
+    for idx in [4, 5, 6]:
+        if len(cleaned_row_data) > idx:
+            cleaned_row_data[idx] = parse_money(cleaned_row_data[idx])
+    if len(cleaned_row_data) > 2:
+        cleaned_row_data[2] = parse_count(cleaned_row_data[2])
+    return cleaned_row_data
+
+
+async def block_heavy_resources_async(context):
+    """block_heavy_resources 的 async_api 版本"""
+    async def handle_route(route):
+        if is_blocked_request(route.request):
+            await route.abort()
+        else:
+            await route.continue_()
+    await context.route("**/*", handle_route)
+
+
+class AsyncBrowserEngine:
+    """BrowserEngine 的 async_api 版本，只在 ScrapeWorker 的事件迴圈上使用"""
+
+    def __init__(self, channel="msedge"):
+        self.channel = channel
+        self.playwright = None
+        self.browsers = {}    # headless -> Browser
+        self.contexts = {}    # (user, site, headless) -> BrowserContext
+        self.idle_pages = {}  # (user, site, headless) -> [Page]
+        self.launch_lock = asyncio.Lock()
+
+    async def get_browser(self, headless=True):
+        # 多個帳號同時抓取時，避免重複啟動 Playwright 或瀏覽器
+        async with self.launch_lock:
+            if self.playwright is None:
+                self.playwright = await async_playwright().start()
+            browser = self.browsers.get(headless)
+            if browser is None or not browser.is_connected():
+                browser = await self.playwright.chromium.launch(channel=self.channel, headless=headless)
+                self.browsers[headless] = browser
+            return browser
+
+    async def get_context(self, user, site, headless=True, storage_state=None, block_resources=False):
+        key = (user, site, headless)
+        context = self.contexts.get(key)
+        if context is not None and not (context.browser and context.browser.is_connected()):
+            self.idle_pages.pop(key, None)
+            context = None
+        if context is None:
+            browser = await self.get_browser(headless)
+            context = await browser.new_context(storage_state=storage_state)
+            if block_resources:
+                await block_heavy_resources_async(context)
+            self.contexts[key] = context
+        return context
+
+    async def acquire_page(self, user, site, headless=True, storage_state=None, block_resources=False):
+        key = (user, site, headless)
+        context = await self.get_context(user, site, headless, storage_state, block_resources)
+        pages = self.idle_pages.get(key, [])
+        while pages:
+            page = pages.pop()
+            if not page.is_closed():
+                return page
+        return await context.new_page()
+
+    async def release_page(self, page):
+        if page is None or page.is_closed():
+            return
+        for key, context in self.contexts.items():
+            if page.context is context:
+                self.idle_pages.setdefault(key, []).append(page)
+                return
+        await page.close()
+
+    async def close_context(self, user, site, headless=True):
+        key = (user, site, headless)
+        self.idle_pages.pop(key, None)
+        context = self.contexts.pop(key, None)
+        if context is not None:
+            await context.close()
+
+    async def shutdown(self):
+        self.idle_pages.clear()
+        for context in self.contexts.values():
+            try:
+                await context.close()
+            except Exception:
+                pass
+        self.contexts.clear()
+        for browser in self.browsers.values():
+            try:
+                await browser.close()
+            except Exception:
+                pass
+        self.browsers.clear()
+        if self.playwright is not None:
+            await self.playwright.stop()
+            self.playwright = None
+
+
+class ScrapeWorker(QObject):
+    """
+    在背景執行緒執行抓取工作，GUI 執行緒不再被分頁迴圈卡住。
+    submit() 回傳 task_id，可用 cancel() 取消；結果與進度一律經由 signal 送回 GUI。
+    """
+    log_message = pyqtSignal(str)
+    page_scraped = pyqtSignal(int, int, int)           # task_id, 分頁數, 累計筆數
+    task_finished = pyqtSignal(int, str, object)       # task_id, 工作名稱, 結果
+    task_failed = pyqtSignal(int, str, object, str)    # task_id, 工作名稱, 例外, traceback
+    task_cancelled = pyqtSignal(int, str)              # task_id, 工作名稱
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.engine = AsyncBrowserEngine()
+        self.loop = asyncio.new_event_loop()
+        self.tasks = {}  # task_id -> concurrent.futures.Future
+        self.task_ids = itertools.count(1)
+        self.thread = threading.Thread(target=self.run_loop, name="scrape-worker", daemon=True)
+        self.thread.start()
+
+    def run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, name, coro_func, *args):
+        """排入抓取工作；coro_func(worker, task_id, *args) 須為 async 函數"""
+        task_id = next(self.task_ids)
+        future = asyncio.run_coroutine_threadsafe(
+            self.run_task(task_id, name, coro_func(self, task_id, *args)), self.loop)
+        self.tasks[task_id] = future
+        future.add_done_callback(lambda f: self.on_task_done(task_id, name, f))
+        return task_id
+
+    async def run_task(self, task_id, name, coro):
+        try:
+            result = await coro
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.task_failed.emit(task_id, name, e, traceback.format_exc())
+        else:
+            self.task_finished.emit(task_id, name, result)
+
+    def on_task_done(self, task_id, name, future):
+        self.tasks.pop(task_id, None)
+        if future.cancelled():
+            self.task_cancelled.emit(task_id, name)
+
+    def cancel(self, task_id):
+        future = self.tasks.get(task_id)
+        if future is not None:
+            future.cancel()
+
+    def run_sync(self, coro, timeout=None):
+        """在背景事件迴圈上執行 coroutine 並等待結果（供 GUI 執行緒少量呼叫）"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def close_browsers(self):
+        """取消所有工作並關閉背景瀏覽器，事件迴圈保留供下次使用"""
+        for future in list(self.tasks.values()):
+            future.cancel()
+        self.run_sync(self.engine.shutdown(), timeout=10)
+
+    def shutdown(self):
+        try:
+            self.close_browsers()
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=5)
+
+
+async def open_seller_page(worker, user, url, state_file, headless, block_resources):
+    """借出賣家後台頁面並導航，登入失效時關閉該 context 並丟出 SessionExpiredError"""
+    page = await worker.engine.acquire_page(user, SITE_SELLER, headless, load_storage_state(state_file),
+                                            block_resources)
+    await navigate_async(page, "seller_table", lambda: page.goto(url, wait_until="domcontentloaded"), user)
+    if not is_seller_session_valid(page):
+        await worker.engine.close_context(user, SITE_SELLER, headless)
+        raise SessionExpiredError(user)
+    await page.context.storage_state(path=state_file)
+    return page
+
+
+async def goto_next_table_page(page):
+    """點擊「Next »」並等到表格內容換頁；沒有下一頁時回傳 False"""
+    next_button = page.locator("a[aria-label='Next »']")
+    if not await next_button.is_visible():
+        return False
+    await navigate_async(page, "seller_table_next", next_button.click)
+    return True
+
+
+# ===============================
+# 分頁直接抓取：依 ?page=N 規則以 APIRequestContext 平行取得 HTML，在瀏覽器外解析
+# ===============================
+PAGE_FETCH_CONCURRENCY = 4  # 一次平行抓取的分頁數
+PAGE_NUMBER_RE = re.compile(r"([?&]page=)(\d+)")
+
+
+class TableRowsParser(HTMLParser):
+    """
+    解析 HTML 中 table tbody tr 的儲存格文字。
+    <br> 與區塊元素轉成換行，空白壓縮，盡量與瀏覽器 innerText 的結果一致
+    （split_and_merge_orders 依換行拆解 Product Info）。
+    """
+    BLOCK_TAGS = {"br", "div", "p", "li", "tr", "table", "ul", "ol"}
+    SKIP_TAGS = {"script", "style"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self.tbody_depth = 0
+        self.row = None
+        self.cell = None
+        self.nested_depth = 0  # 儲存格內巢狀的 td/table
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth += 1
+        elif self.cell is not None:
+            if tag in ("td", "table"):
+                self.nested_depth += 1
+            if tag in self.BLOCK_TAGS:
+                self.cell.append("\n")
+        elif tag == "tbody":
+            self.tbody_depth += 1
+        elif tag == "tr" and self.tbody_depth:
+            self.row = []
+        elif tag == "td" and self.row is not None:
+            self.cell = []
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+        elif self.cell is not None:
+            if tag == "td" and not self.nested_depth:
+                self.row.append(self.cell_text())
+                self.cell = None
+                return
+            if tag in ("td", "table"):
+                self.nested_depth = max(self.nested_depth - 1, 0)
+            if tag in self.BLOCK_TAGS:
+                self.cell.append("\n")
+        elif tag == "tr" and self.row is not None:
+            self.rows.append(self.row)
+            self.row = None
+        elif tag == "tbody":
+            self.tbody_depth = max(self.tbody_depth - 1, 0)
+
+    def handle_data(self, data):
+        if self.cell is not None and not self.skip_depth:
+            self.cell.append(re.sub(r"\s+", " ", data))
+
+    def cell_text(self):
+        lines = (line.strip() for line in "".join(self.cell).split("\n"))
+        return "\n".join(line for line in lines if line)
+
+
+def parse_table_rows(html):
+    """在瀏覽器外解析表格，回傳格式與 TABLE_ROWS_JS 相同"""
+    parser = TableRowsParser()
+    parser.feed(html)
+    parser.close()
+    return parser.rows
+
+
+def page_url(next_href, page_no):
+    """把「Next »」連結中的 page=N 換成指定頁碼"""
+    return PAGE_NUMBER_RE.sub(lambda m: f"{m.group(1)}{page_no}", next_href, count=1)
+
+
+async def find_pagination(page):
+    """
+    讀取目前頁面的分頁連結，回傳 (next_href, last_page)：
+    沒有下一頁時 next_href 為 None；有下一頁但找不到 ?page=N 規則時為 ""。
+    last_page 為分頁列上看得到的最大頁碼，只用來決定每批抓幾頁。
+    """
+    next_button = page.locator("a[aria-label='Next »']")
+    if not await next_button.is_visible():
+        return None, 1
+    next_href = await next_button.evaluate("a => a.href") or ""
+    if not PAGE_NUMBER_RE.search(next_href):
+        return "", None
+    hrefs = await page.eval_on_selector_all("a[href*='page=']", "links => links.map(a => a.href)")
+    page_numbers = [int(m.group(2)) for m in map(PAGE_NUMBER_RE.search, hrefs) if m]
+    return next_href, max(page_numbers) if page_numbers else None
+
+
+def has_data_rows(rows):
+    """超過最後一頁時表格為空，或只剩一列合併儲存格的「查無資料」"""
+    return any(len(row) > 1 for row in rows)
+
+
+async def fetch_table_page(request, url):
+    """以已登入 context 的 APIRequestContext 取得分頁 HTML 並解析表格"""
+    start = time.perf_counter()
+    response = await request.get(url)
+    latency_profile.record("", "seller_table_fetch", "request", url, time.perf_counter() - start, 0)
+    if "/users/login" in response.url:
+        raise SessionExpiredError(url)
+    if not response.ok:
+        raise RuntimeError(f"抓取分頁失敗：{url} HTTP {response.status}")
+    return parse_table_rows(await response.text())
+
+
+async def iter_table_pages(page, concurrency=PAGE_FETCH_CONCURRENCY):
+    """
+    依序產生每一分頁的表格列。
+    第一頁直接讀取瀏覽器畫面；之後的分頁若找得到 ?page=N 規則，就一次平行抓取數頁，
+    直到遇到空白或重複的分頁為止，否則退回點擊「Next »」。
+    呼叫端 break 即停止，最多多抓 concurrency - 1 頁。
+    """
+    await page.wait_for_selector("table tbody tr", timeout=10000)
+    previous_rows = await extract_table_rows(page)
+    yield previous_rows
+
+    next_href, last_page = await find_pagination(page)
+    if next_href is None:
+        return
+    if next_href:
+        page_no = 2
+        while True:
+            if last_page is not None and page_no <= last_page:
+                batch_size = min(concurrency, last_page + 1 - page_no)
+            elif last_page is not None:
+                batch_size = 1  # 超過分頁列顯示的頁碼，逐頁確認是否還有資料
+            else:
+                batch_size = concurrency
+            batch = await asyncio.gather(*(fetch_table_page(page.context.request, page_url(next_href, n))
+                                           for n in range(page_no, page_no + batch_size)))
+            if page_no == 2 and (not has_data_rows(batch[0]) or batch[0] == previous_rows):
+                break  # 分頁 HTML 沒有表格（前端渲染）或網站不認 page 參數，改用點擊翻頁
+            for rows in batch:
+                if not has_data_rows(rows) or rows == previous_rows:
+                    return
+                previous_rows = rows
+                yield rows
+            page_no += batch_size
+
+    while await goto_next_table_page(page):
+        await page.wait_for_selector("table tbody tr", timeout=10000)
+        yield await extract_table_rows(page)
+
+
+async def scrape_orders_async(worker, task_id, user, state_file, watermark_codes, watermark_loader, headless,
+                              block_resources):
+    """
+    抓取 /seller/orders 中比水位新的訂單，分頁越過水位即停止；回傳 pending 與非 pending 訂單。
+    沒有水位（首次同步）時才會抓取全部分頁。
+    watermark_loader 在 Google 執行緒中讀取雲端水位，併入本機水位後才開始抓取，結果放在 cloud_watermark。
+    """
+    cloud_codes = []
+    if watermark_loader is not None:
+        try:
+            cloud_codes = await asyncio.get_running_loop().run_in_executor(google_credentials.executor,
+                                                                           watermark_loader)
+        except Exception:
+            worker.log_message.emit(f"[{user}] 讀取雲端水位時出錯，改用本機水位：{traceback.format_exc()}")
+        watermark_codes = merge_watermark_codes(watermark_codes, cloud_codes)
+    watermark = OrderWatermark(watermark_codes)
+    if watermark.order_codes:
+        worker.log_message.emit(f"[{user}] 水位：{watermark.high}（共 {len(watermark.order_codes)} 筆）")
+    else:
+        worker.log_message.emit(f"[{user}] 尚無同步水位，首次同步將抓取全部訂單。")
+    worker.log_message.emit(f"[{user}] 正在導航到訂單頁面...")
+    page = await open_seller_page(worker, user, SELLER_ORDERS_URL, state_file, headless, block_resources)
+    pending_orders = []
+    rest_orders = []
+    seen_codes = []  # 越過水位的訂單編號，用來驗證重疊
+    page_no = 0
+    try:
+        async for rows in iter_table_pages(page):
+            page_no += 1
+            worker.log_message.emit(f"[{user}] 正在抓取第 {page_no} 頁訂單資料...")
+            for row_data in rows:
+                cleaned_row_data = clean_order_row(row_data)
+                order_code = cleaned_row_data[1] if len(cleaned_row_data) > 1 else ""
+                status = str(cleaned_row_data[7]).lower() if len(cleaned_row_data) > 7 else ""
+                if not watermark.is_new(order_code):
+                    seen_codes.append(order_code)
+                    if not watermark.comparable:
+                        break  # 無法比較先後時沿用舊作法：遇到水位訂單即停止
+                    continue  # 同一頁可能還有排序錯置的新訂單，整頁看完再停止
+                if status == "pending":
+                    pending_orders.append(cleaned_row_data)
+                else:
+                    rest_orders.append(cleaned_row_data)
+            worker.page_scraped.emit(task_id, page_no, len(pending_orders) + len(rest_orders))
+            if seen_codes:
+                worker.log_message.emit(f"[{user}] 第 {page_no} 頁已越過水位，停止抓取。")
+                break
+        else:
+            worker.log_message.emit(f"[{user}] 所有分頁抓取完畢。")
+            if watermark.order_codes:
+                worker.log_message.emit(f"[{user}] 警告：抓完所有分頁仍未越過水位，請確認水位是否正確。")
+    finally:
+        await worker.engine.release_page(page)
+    overlap = watermark.verify_overlap(seen_codes) if seen_codes else None
+    if overlap:
+        worker.log_message.emit(f"[{user}] {overlap}")
+    return {"user": user, "pending_orders": pending_orders, "rest_orders": rest_orders,
+            "cloud_watermark": cloud_codes}
+
+
+async def sync_account_orders_async(worker, task_id, user, state_file, watermark_codes, watermark_loader, slots,
+                                    headless, block_resources):
+    """全部帳號同步用：取得 slots 名額後才開始抓取，限制同時進行的帳號數"""
+    async with slots:
+        result = await scrape_orders_async(worker, task_id, user, state_file, watermark_codes, watermark_loader,
+                                           headless, block_resources)
+    result["batch"] = True
+    return result
+
+
+# Order Code 形如 20250315-221502656，固定寬度，字串大小即時間先後；訂單列表由新到舊排列
+ORDER_CODE_RE = re.compile(r"^\d{8}-\d+$")
+
+
+WATERMARK_SIZE = 20  # 每個帳號保留的水位訂單數
+
+
+class OrderWatermark:
+    """
+    上次同步看到的最新 N 筆 Order Code。比水位最高者新的訂單才需要抓取；
+    越過水位後，比對重疊區段中的水位訂單是否都還在，以察覺刪單或排序異常。
+    """
+
+    def __init__(self, order_codes):
+        self.order_codes = sorted({str(code).strip() for code in order_codes if str(code).strip()}, reverse=True)
+        self.high = self.order_codes[0] if self.order_codes else None
+        # 水位都是 YYYYMMDD-N 格式才能以字串比較先後，否則只能逐筆比對
+        self.comparable = bool(self.order_codes) and all(ORDER_CODE_RE.match(code) for code in self.order_codes)
+
+    def is_new(self, order_code):
+        if not self.order_codes:
+            return True
+        if self.comparable and ORDER_CODE_RE.match(order_code):
+            return order_code > self.high
+        return order_code not in self.order_codes
+
+    def verify_overlap(self, seen_codes):
+        """檢查越過水位的分頁中，應出現的水位訂單是否都看得到；回傳記錄用訊息"""
+        if not self.comparable:
+            return f"遇到水位訂單 {seen_codes[0]}，停止抓取。"
+        oldest_seen = min(seen_codes)
+        expected = [code for code in self.order_codes if code >= oldest_seen]
+        missing = [code for code in expected if code not in set(seen_codes)]
+        if not expected:
+            return "警告：越過水位的分頁中找不到任何水位訂單，水位訂單可能已被刪除，請確認是否漏抓。"
+        if missing:
+            return (f"警告：水位重疊驗證發現 {len(missing)}/{len(expected)} 筆水位訂單不在列表中"
+                    f"（可能已被刪除）：{'、'.join(missing)}")
+        return f"水位重疊驗證通過（{len(expected)} 筆水位訂單皆在列表中）。"
+
+
+def oldest_order_code(rows):
+    """分頁中最舊（最小）的 Order Code；沒有訂單時回傳 None"""
+    codes = [row[1].strip() for row in rows if len(row) > 1 and ORDER_CODE_RE.match(row[1].strip())]
+    return min(codes) if codes else None
+
+
+class OrderPageLocator:
+    """
+    以 ?page=N 直接跳頁，二分搜尋某個 Order Code 所在的分頁。
+    抓過的分頁會暫存，定位起訖分頁時不重複抓取。
+    """
+
+    def __init__(self, page, next_href, first_rows):
+        self.request = page.context.request
+        self.next_href = next_href
+        self.pages = {1: first_rows}
+        self.fetch_count = 0
+
+    async def rows(self, page_no):
+        if page_no not in self.pages:
+            self.pages[page_no] = await fetch_table_page(self.request, page_url(self.next_href, page_no))
+            self.fetch_count += 1
+        return self.pages[page_no]
+
+    async def reaches(self, page_no, order_code):
+        """分頁中已出現 <= order_code 的訂單；超過最後一頁的空白分頁也視為已到達"""
+        oldest = oldest_order_code(await self.rows(page_no))
+        return oldest is None or oldest <= order_code
+
+    async def locate(self, order_code, low=1):
+        """
+        回傳第一個包含 <= order_code 訂單的頁碼（>= low）。
+        先以倍增找出上界，再於區間內二分搜尋，只需 O(log 頁數) 次跳頁。
+        """
+        if await self.reaches(low, order_code):
+            return low
+        high = low + 1
+        while not await self.reaches(high, order_code):
+            low, high = high, high + (high - low) * 2
+        while high - low > 1:
+            middle = (low + high) // 2
+            if await self.reaches(middle, order_code):
+                high = middle
+            else:
+                low = middle
+        return high
+
+
+async def locate_order_range_rows(worker, task_id, user, page, start_order, end_order):
+    """
+    二分搜尋 start_order 與 end_order 所在的分頁，只抓取兩者之間的分頁。
+    網站不支援 ?page=N 時回傳 None，由呼叫端改為逐頁掃描。
+    """
+    await page.wait_for_selector("table tbody tr", timeout=10000)
+    first_rows = await extract_table_rows(page)
+    next_href, _ = await find_pagination(page)
+    if next_href == "":
+        return None
+    locator = OrderPageLocator(page, next_href, first_rows)
+    if next_href is not None:
+        second_rows = await locator.rows(2)
+        if not has_data_rows(second_rows) or second_rows == first_rows:
+            return None  # 分頁 HTML 沒有表格（前端渲染）或網站不認 page 參數
+
+    start_page = await locator.locate(start_order) if next_href else 1
+    end_page = await locator.locate(end_order, start_page) if next_href else 1
+    worker.log_message.emit(f"[{user}] 起始訂單位於第 {start_page} 頁，結束訂單位於第 {end_page} 頁"
+                            f"（定位共跳頁 {locator.fetch_count} 次）")
+
+    span = range(start_page, end_page + 1)
+    rows = []
+    for batch_start in range(0, len(span), PAGE_FETCH_CONCURRENCY):
+        batch = span[batch_start:batch_start + PAGE_FETCH_CONCURRENCY]
+        for page_rows in await asyncio.gather(*(locator.rows(page_no) for page_no in batch)):
+            rows.extend(page_rows)
+        worker.page_scraped.emit(task_id, batch[-1], len(rows))
+    return rows
+
+
+def select_order_range(rows, start_order, end_order):
+    """從起始訂單記錄到結束訂單（含），兩者都需完全相符；回傳 (訂單列, 是否找到結束訂單)"""
+    all_data = []
+    start_scraping = False
+    for row_data in rows:
+        cleaned_row_data = [cell.strip() for cell in row_data]
+        order_code = cleaned_row_data[1] if len(cleaned_row_data) > 1 else ""
+        if order_code == start_order:
+            start_scraping = True
+        if start_scraping:
+            all_data.append(cleaned_row_data)
+        if order_code == end_order:
+            return all_data, True
+    return all_data, False
+
+
+async def scan_order_range(worker, task_id, page, start_order, end_order):
+    """逐頁掃描到起始訂單為止；訂單編號格式不符或網站不支援 ?page=N 時使用"""
+    all_data = []
+    start_scraping = False
+    found_end_order = False
+    page_no = 0
+    async for rows in iter_table_pages(page):
+        page_no += 1
+        worker.log_message.emit(f"正在抓取第 {page_no} 頁訂單資料...")
+        for row_data in rows:
+            cleaned_row_data = [cell.strip() for cell in row_data]
+            order_code = cleaned_row_data[1] if len(cleaned_row_data) > 1 else ""
+            worker.log_message.emit(f"當前處理訂單編號: {order_code}")
+            if order_code == start_order:
+                start_scraping = True
+                worker.log_message.emit("找到起始訂單，開始記錄資料...")
+            if order_code == end_order:
+                worker.log_message.emit("已找到結束訂單，停止記錄並退出...")
+                if start_scraping:
+                    all_data.append(cleaned_row_data)
+                found_end_order = True
+                break
+            if start_scraping:
+                all_data.append(cleaned_row_data)
+        worker.page_scraped.emit(task_id, page_no, len(all_data))
+        if found_end_order:
+            break
+    else:
+        worker.log_message.emit("已遍歷所有分頁，但未找到結束訂單。")
+    return all_data
+
+
+async def scrape_order_range_async(worker, task_id, user, state_file, start_order, end_order, headless,
+                                   block_resources):
+    """抓取 start_order 到 end_order 之間（含）的訂單"""
+    worker.log_message.emit("正在導航到訂單頁面...")
+    page = await open_seller_page(worker, user, SELLER_ORDERS_URL, state_file, headless, block_resources)
+    try:
+        rows = None
+        if ORDER_CODE_RE.match(start_order) and ORDER_CODE_RE.match(end_order):
+            rows = await locate_order_range_rows(worker, task_id, user, page, start_order, end_order)
+        if rows is not None:
+            all_data, found_end_order = select_order_range(rows, start_order, end_order)
+            if not all_data:
+                worker.log_message.emit("在定位的分頁中找不到起始訂單。")
+            elif not found_end_order:
+                worker.log_message.emit("在定位的分頁中找不到結束訂單。")
+        else:
+            all_data = await scan_order_range(worker, task_id, page, start_order, end_order)
+    finally:
+        await worker.engine.release_page(page)
+    return {"user": user, "start_order": start_order, "end_order": end_order, "orders": all_data}
+
+
+async def scrape_products_async(worker, task_id, user, state_file, headless, block_resources):
+    """抓取 /seller/products 所有分頁"""
+    worker.log_message.emit("正在導航到產品頁面...")
+    page = await open_seller_page(worker, user, SELLER_PRODUCTS_URL, state_file, headless, block_resources)
+    all_data = []
+    page_no = 0
+    try:
+        async for rows in iter_table_pages(page):
+            page_no += 1
+            worker.log_message.emit(f"正在抓取第 {page_no} 頁產品資料...")
+            all_data.extend([cell.strip() for cell in row_data] for row_data in rows)
+            worker.page_scraped.emit(task_id, page_no, len(all_data))
+        worker.log_message.emit("所有分頁抓取完畢。")
+    finally:
+        await worker.engine.release_page(page)
+    return {"user": user, "products": all_data}
+
+
+# ===============================
+# 批次加入購物車（百寶倉 WooCommerce 商品頁）
+# ===============================
+CART_CONCURRENCY = 3  # 預設同時開啟的商品分頁數
+CART_LINE_COLUMNS = ["Product Name", "Attribute", "Quantity", "Product URL"]
+VARIATION_SELECTS_JS = """selects => selects.map(select => ({
+    name: select.name,
+    label: (select.id && select.form.querySelector(`label[for="${select.id}"]`)?.innerText) || "",
+    options: Array.from(select.options).filter(option => option.value).map(option => [option.value, option.text]),
+}))"""
+
+
+class CartError(Exception):
+    """單一商品無法自動加入購物車；args[0] 為原因，列入失敗清單由操作員手動處理"""
+
+
+def normalize_variation_text(text):
+    """規格比對用：忽略大小寫與所有空白（含 &nbsp;）"""
+    return re.sub(r"\s+", "", str(text)).lower()
+
+
+def variation_attribute_key(name):
+    """規格名稱比對用：只保留文字與數字，「Dark Color」、「dark-color」、「pa_dark_color」視為相同"""
+    return re.sub(r"[\W_]+", "", str(name)).lower()
+
+
+def parse_variation_attributes(attribute):
+    """
+    將 Attribute（如「Color:Dark Brown, Size:M」）拆成 {規格名稱鍵: 值}。
+    沒有名稱的單一值（如「Red」）放在鍵 "" 之下，只在商品頁只有一個下拉選單時使用。
+    """
+    pairs = {}
+    unnamed = []
+    for part in re.split(r"[,，;；\n]", str(attribute).replace("：", ":")):
+        name, sep, value = part.partition(":")
+        if sep and name.strip() and value.strip():
+            pairs[variation_attribute_key(name)] = value.strip()
+        elif part.strip():
+            unnamed.append(part.strip())
+    if len(unnamed) == 1:
+        pairs[""] = unnamed[0]
+    return pairs
+
+
+def variation_select_keys(select):
+    """下拉選單可對應的規格名稱鍵：attribute_pa_<slug>、attribute_<slug> 與畫面上的標籤"""
+    name = re.sub(r"^attribute_(pa_)?", "", select["name"])
+    return {key for key in (variation_attribute_key(name), variation_attribute_key(select.get("label", ""))) if key}
+
+
+def match_variation_option(options, value):
+    """回傳選項值或顯示文字與 value 完全相同（忽略大小寫與空白）的選項值；沒有時回傳 None，不做模糊比對"""
+    target = normalize_variation_text(value)
+    for option_value, text in options:
+        if target in (normalize_variation_text(option_value), normalize_variation_text(text)):
+            return option_value
+    return None
+
+
+async def add_product_to_cart(page, line, submit_lock, user=""):
+    """開啟商品頁、依 Attribute 選擇規格、填入數量後加入購物車；失敗時丟出 CartError"""
+    url = line["Product URL"]
+    if not is_product_url(url):
+        raise CartError("沒有商品網址")
+    await navigate_async(page, "buyer_product", lambda: page.goto(url, wait_until="domcontentloaded"), user)
+    if await page.locator("body.error404").count():
+        raise CartError("商品頁面不存在")
+
+    if await page.locator("form.variations_form").count():
+        selects = await page.eval_on_selector_all("form.variations_form select[name^='attribute_']",
+                                                  VARIATION_SELECTS_JS)
+        attributes = parse_variation_attributes(line["Attribute"])
+        for select in selects:
+            keys = variation_select_keys(select) & attributes.keys()
+            if keys:
+                wanted = attributes[keys.pop()]
+            elif len(selects) == 1 and "" in attributes:
+                wanted = attributes[""]
+            else:
+                raise CartError(f"「{line['Attribute']}」中沒有 {select.get('label') or select['name']} 規格")
+            value = match_variation_option(select["options"], wanted)
+            if value is None:
+                choices = "、".join(text for _, text in select["options"])
+                raise CartError(f"找不到與「{wanted}」完全相同的規格（可選：{choices}）")
+            await page.select_option(f"form.variations_form select[name='{select['name']}']", value)
+
+    await page.fill("form.cart input.qty", str(int(line["Quantity"])))
+    button_selector = "form.cart button.single_add_to_cart_button"
+    try:
+        await page.wait_for_selector(f"{button_selector}:not(.disabled)", timeout=5000)
+    except PlaywrightAsyncTimeoutError:
+        raise CartError("此規格目前無法購買（缺貨或規格組合不存在）")
+
+    # 同一帳號的購物車存在同一個 session，同時送出會互相覆蓋，因此逐一送出
+    async with submit_lock:
+        await navigate_async(page, "buyer_cart_added", page.locator(button_selector).click, user)
+    error = page.locator(".woocommerce-error")
+    if await error.count():
+        raise CartError((await error.first.inner_text()).strip())
+
+
+async def add_to_cart_batch_async(worker, task_id, user, state_file, lines, concurrency, headless,
+                                  block_resources):
+    """
+    以最多 concurrency 個分頁同時開啟商品頁並加入購物車。
+    回傳 {"user", "added", "failures"}，failures 中每筆附上失敗原因。
+    """
+    storage_state = load_storage_state(state_file)
+    page = await worker.engine.acquire_page(user, SITE_BUYER, headless, storage_state, block_resources)
+    context = page.context
+    try:
+        await navigate_async(page, "buyer_account",
+                             lambda: page.goto(BUYER_ACCOUNT_URL, wait_until="domcontentloaded"), user)
+        if await page.locator('input[name="username"]').count():
+            await worker.engine.close_context(user, SITE_BUYER, headless)
+            discard_storage_state(state_file)
+            raise RuntimeError("百寶倉登入狀態已失效，請先以逐筆出貨重新登入一次。")
+    finally:
+        await worker.engine.release_page(page)
+
+    slots = asyncio.Semaphore(concurrency)
+    submit_lock = asyncio.Lock()
+    added = []
+    failures = []
+
+    async def add_line(line):
+        async with slots:
+            page = await worker.engine.acquire_page(user, SITE_BUYER, headless, storage_state, block_resources)
+            reason = None
+            try:
+                await add_product_to_cart(page, line, submit_lock, user)
+            except CartError as e:
+                reason = e.args[0]
+            except PlaywrightAsyncTimeoutError:
+                reason = "頁面未在時限內回應"
+            except PlaywrightAsyncError as e:
+                reason = f"瀏覽器操作失敗：{e.message.splitlines()[0]}"
+            finally:
+                await worker.engine.release_page(page)
+        progress = f"({len(added) + len(failures) + 1}/{len(lines)})"
+        item = f"{line['Product Name']} - {line['Attribute']} x {line['Quantity']}"
+        if reason is None:
+            added.append(line)
+            worker.log_message.emit(f"[{user}] {progress} 已加入購物車：{item}")
+        else:
+            failures.append({**line, "原因": reason})
+            worker.log_message.emit(f"[{user}] {progress} 無法加入購物車：{item}，{reason}")
+
+    await asyncio.gather(*(add_line(line) for line in lines))
+    await context.storage_state(path=state_file)
+    return {"user": user, "added": added, "failures": failures}
+
+
+# ===============================
+# 訂單產品拆分與合併（向量化）
+# ===============================
+SPLIT_COLUMNS = ["Order Code", "Product Name", "Attribute", "Quantity"]
+INT_QUANTITY_RE = r"[+-]?\d+(?:_\d+)*"  # 與 int() 可接受的整數字串一致
+
+
+def split_product_info(df):
+    """
+    將每筆訂單的 Product Info（每行「名稱 | 規格 | 數量」）拆成一列一個產品。
+    回傳 (split_df, warnings)，warnings 依原本逐行處理的順序排列。
+    """
+    info = df.loc[df["Product Info"].map(lambda value: isinstance(value, str)), ["Order Code", "Product Info"]]
+    if info.empty:
+        return pd.DataFrame([], columns=SPLIT_COLUMNS), []
+
+    lines = (info.assign(line=info["Product Info"].str.strip().str.split("\n"))
+             .explode("line")[["Order Code", "line"]]
+             .reset_index(drop=True))
+    has_three_parts = lines["line"].str.count(r"\|") >= 2
+    parts = lines["line"].str.split("|", n=3, expand=True).reindex(columns=range(3)).fillna("")
+    quantity_str = parts[2].str.strip()
+    valid_quantity = has_three_parts & quantity_str.str.fullmatch(INT_QUANTITY_RE)
+
+    bad_format = ~has_three_parts
+    bad_quantity = has_three_parts & ~valid_quantity
+    warnings = pd.concat([
+        "警告：無法解析產品資訊：" + lines.loc[bad_format, "line"],
+        "警告：數量無法解析，忽略此產品。訂單編號：" + lines.loc[bad_quantity, "Order Code"].astype(str)
+        + "，產品資訊：" + lines.loc[bad_quantity, "line"],
+    ]).sort_index().tolist()
+
+    if not valid_quantity.any():
+        return pd.DataFrame([], columns=SPLIT_COLUMNS), warnings
+    split_df = pd.DataFrame({
+        "Order Code": lines.loc[valid_quantity, "Order Code"],
+        "Product Name": parts.loc[valid_quantity, 0].str.strip(),
+        "Attribute": parts.loc[valid_quantity, 1].str.strip().str.replace("；", "", regex=False).str.strip(),
+        "Quantity": quantity_str[valid_quantity].str.replace("_", "", regex=False).astype("int64"),
+    }).reset_index(drop=True)
+    return split_df, warnings
+
+
+def merge_split_orders(split_df):
+    """依 (Product Name, Attribute) 合併：訂單編號以 ; 串接、數量加總"""
+    return split_df.groupby(["Product Name", "Attribute"], as_index=False).agg({
+        "Order Code": ";".join,
+        "Quantity": "sum"
+    })
+
+
+# ===============================
+# 產品目錄服務（快取 products_list.xlsx）
+# ===============================
+PRODUCTS_FILE = "products_list.xlsx"
+
+
+class ProductStoreError(Exception):
+    """產品目錄已寫回工作表，但同步到訂單資料庫失敗"""
+
+
+class ProductCatalog:
+    """
+    單一帳號的 products_list.xlsx 快取：只在檔案修改時間或大小改變時重讀，
+    並保留 名稱 -> url、名稱 -> 進貨價 對照與正規化名稱索引。
+    """
+
+    def __init__(self, products_file):
+        self.products_file = products_file
+        self.file_key = None
+        self.df_products = None
+        self.url_map = {}
+        self.price_map = {}
+        self.url_index = None  # 缺少 Name 或 url 欄位時為 None
+
+    def exists(self):
+        return os.path.exists(self.products_file)
+
+    def refresh(self):
+        """確認快取與檔案一致，回傳目錄是否存在"""
+        try:
+            file_key = product_file_key(self.products_file)
+        except FileNotFoundError:
+            self.invalidate()
+            return False
+        if file_key != self.file_key:
+            df_products = pd.read_excel(self.products_file)
+            has_name = "Name" in df_products.columns
+            has_url = has_name and "url" in df_products.columns
+            self.df_products = df_products
+            self.url_map = dict(zip(df_products["Name"], df_products["url"])) if has_url else {}
+            self.price_map = (dict(zip(df_products["Name"], df_products["進貨價"]))
+                              if has_name and "進貨價" in df_products.columns else {})
+            self.url_index = build_product_url_index(df_products) if has_url else None
+            self.file_key = file_key
+        return True
+
+    def frame(self):
+        """目錄內容的副本，供編輯後以 save() 寫回"""
+        if not self.refresh():
+            raise FileNotFoundError(self.products_file)
+        return self.df_products.copy()
+
+    def save(self, df_products):
+        replace_file_atomically(self.products_file, lambda path: df_products.to_excel(path, index=False))
+        self.invalidate()
+
+    def save_rows(self, df_products, rows, columns, file_key, order_store=None):
+        """
+        只把指定列、指定欄位寫回工作表，其他儲存格不經 pandas 重建。
+        df_products 必須是 file_key 對應版本的 frame()，檔案在編輯期間被改寫時拒絕儲存，避免列位置錯開。
+        有 order_store 時，這些產品編輯過的欄位也一併寫入訂單資料庫；工作表已儲存但資料庫寫入失敗時
+        丟出 ProductStoreError，讓呼叫端分開回報。
+        """
+        write_product_rows(self.products_file, df_products, rows, columns, file_key)
+        self.invalidate()
+        if order_store is not None:
+            user = os.path.basename(os.path.dirname(os.path.abspath(self.products_file)))
+            try:
+                order_store.save_product_fields(user, df_products.iloc[list(rows)], columns)
+            except Exception as e:
+                raise ProductStoreError(f"{PRODUCTS_FILE} 已儲存，但寫入訂單資料庫時出錯：{e}") from e
+
+    def invalidate(self):
+        self.file_key = None
+        self.df_products = None
+        self.url_map = {}
+        self.price_map = {}
+        self.url_index = None
+
+
+class ProductCatalogService:
+    """依使用者目錄取得產品目錄；同一帳號在整個程式中共用一份快取"""
+
+    def __init__(self):
+        self.catalogs = {}
+
+    def catalog(self, user_dir):
+        products_file = os.path.join(user_dir, PRODUCTS_FILE)
+        if products_file not in self.catalogs:
+            self.catalogs[products_file] = ProductCatalog(products_file)
+        return self.catalogs[products_file]
+
+
+product_catalogs = ProductCatalogService()
+
+
+# ===============================
+# 銷售帳本（增量更新 sales.xlsx）
+# ===============================
+SALES_LEDGER_FILE = "sales_ledger.json"
+
+
+class SalesLedger:
+    """
+    記錄每個 goshop_orders*.xlsx 的營收，以 (檔名, 修改時間, 檔案大小) 判斷是否需要重讀。
+    只有新增或變更的訂單檔才會 read_excel，已刪除的檔案自動從帳本移除。
+    """
+
+    def __init__(self, user_dir):
+        self.user_dir = user_dir
+        self.ledger_file = os.path.join(user_dir, SALES_LEDGER_FILE)
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.ledger_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}  # 帳本不存在或損毀時全部重讀
+
+    def save(self):
+        with open(self.ledger_file, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+
+    def refresh(self):
+        """同步帳本與目錄中的訂單檔，回傳重讀的檔案數"""
+        entries = {}
+        reread = 0
+        for file_name in sorted(os.listdir(self.user_dir)):
+            if not (file_name.startswith("goshop_orders") and file_name.endswith(".xlsx")):
+                continue
+            stat = os.stat(os.path.join(self.user_dir, file_name))
+            entry = self.entries.get(file_name)
+            if entry is None or entry["mtime"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+                df = pd.read_excel(os.path.join(self.user_dir, file_name), sheet_name="原始資料")
+                entry = {"mtime": stat.st_mtime_ns, "size": stat.st_size,
+                         "revenue": float(df["Final price"].sum())}
+                reread += 1
+            entries[file_name] = entry
+        changed = reread or entries.keys() != self.entries.keys()
+        self.entries = entries
+        if changed:
+            self.save()
+        return reread
+
+    def sales_records(self):
+        """銷售記錄工作表內容"""
+        return pd.DataFrame(
+            [{"檔案名": file_name, "revenue": entry["revenue"]} for file_name, entry in self.entries.items()],
+            columns=["檔案名", "revenue"],
+        )
+
+    def total_revenue(self):
+        return round(sum(entry["revenue"] for entry in self.entries.values()), 2)
+
+
+# ===============================
+# 訂單資料庫（SQLite，Excel 僅作為匯出格式）
+# ===============================
+ORDER_STORE_FILE = "goshop_orders.db"
+ORDER_DATE_RE = re.compile(r"^(\d{4})(\d{2})(\d{2})-")
+
+ORDER_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    order_code       TEXT PRIMARY KEY,
+    user             TEXT NOT NULL,
+    order_date       TEXT NOT NULL,
+    row_number       TEXT,
+    num_products     INTEGER,
+    customer         TEXT,
+    amount           REAL,
+    service_charge   REAL,
+    final_price      REAL,
+    delivery_status  TEXT,
+    payment_status   TEXT,
+    product_info     TEXT,
+    options          TEXT,
+    scraped_at       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_user_date ON orders (user, order_date);
+
+CREATE TABLE IF NOT EXISTS order_lines (
+    order_code    TEXT NOT NULL,
+    line_no       INTEGER NOT NULL,
+    product_name  TEXT NOT NULL,
+    attribute     TEXT,
+    quantity      INTEGER NOT NULL,
+    PRIMARY KEY (order_code, line_no)
+);
+
+CREATE TABLE IF NOT EXISTS watermarks (
+    user         TEXT NOT NULL,
+    order_code   TEXT NOT NULL,
+    order_date   TEXT NOT NULL,
+    recorded_at  TEXT NOT NULL,
+    PRIMARY KEY (user, order_code)
+);
+
+CREATE TABLE IF NOT EXISTS products (
+    user            TEXT NOT NULL,
+    name            TEXT NOT NULL,
+    category        TEXT,
+    current_qty     TEXT,
+    base_price      TEXT,
+    published       TEXT,
+    examine_status  TEXT,
+    url             TEXT,
+    purchase_price  REAL,
+    updated_at      TEXT NOT NULL,
+    PRIMARY KEY (user, name)
+);
+"""
+
+
+# 產品目錄中可由使用者編輯的欄位 -> products 表欄位
+PRODUCT_STORE_FIELDS = {"url": "url", "進貨價": "purchase_price"}
+
+
+def order_date_from_code(order_code, default):
+    """Order Code 形如 20250315-221502656，前 8 碼即下單日期"""
+    match = ORDER_DATE_RE.match(str(order_code))
+    if not match:
+        return default
+    return "-".join(match.groups())
+
+
+class OrderStore:
+    """
+    所有帳號共用的 SQLite 訂單庫，以 Order Code 為主鍵 upsert。
+    每次寫入都在同一個交易內完成，失敗時整批回復。
+    """
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        with closing(self.connect()) as conn:
+            conn.executescript(ORDER_STORE_SCHEMA)
+
+    def connect(self):
+        # 每次操作各自開連線，GUI 執行緒與其他執行緒不共用連線
+        return sqlite3.connect(self.db_file)
+
+    def save_orders(self, user, df_orders, split_df):
+        """
+        寫入訂單與拆分後品項；同一 Order Code 再次寫入時覆蓋舊資料，回傳寫入筆數。
+        依範圍抓取的訂單金額仍是 "$1,234.50" 之類的文字，寫入前一律轉成數字。
+        """
+        now = datetime.now()
+        scraped_at = now.strftime("%Y-%m-%d %H:%M:%S")
+        today = now.strftime("%Y-%m-%d")
+        order_rows = [
+            (str(row["Order Code"]).strip(), user, order_date_from_code(row["Order Code"], today), str(row["#"]),
+             parse_count(row["Num. of Products"]), row["Customer"], parse_money(row["Amount"]),
+             parse_money(row["Service charge"]), parse_money(row["Final price"]), row["Delivery Status"], row["Payment Status"], row["Product Info"],
+             row["Options"], scraped_at)
+            for row in df_orders[ORDER_COLUMNS].to_dict("records")
+        ]
+        lines = split_df.assign(line_no=split_df.groupby("Order Code").cumcount())
+        line_rows = [
+            (str(code).strip(), int(line_no), name, attribute, int(quantity))
+            for code, line_no, name, attribute, quantity in zip(
+                lines["Order Code"], lines["line_no"], lines["Product Name"], lines["Attribute"], lines["Quantity"])
+        ]
+        with closing(self.connect()) as conn, conn:
+            conn.executemany("""
+                INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (order_code) DO UPDATE SET
+                    user = excluded.user, order_date = excluded.order_date, row_number = excluded.row_number,
+                    num_products = excluded.num_products, customer = excluded.customer,
+                    amount = excluded.amount, service_charge = excluded.service_charge,
+                    final_price = excluded.final_price, delivery_status = excluded.delivery_status,
+                    payment_status = excluded.payment_status, product_info = excluded.product_info,
+                    options = excluded.options, scraped_at = excluded.scraped_at
+            """, order_rows)
+            conn.executemany("DELETE FROM order_lines WHERE order_code = ?",
+                             [(row[0],) for row in order_rows])
+            conn.executemany("INSERT INTO order_lines VALUES (?, ?, ?, ?, ?)", line_rows)
+        return len(order_rows)
+
+    def save_products(self, user, df_products):
+        """寫入產品目錄；已存在的產品保留原本的進貨價"""
+        updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = [
+            (user, str(row["Name"]).strip(), row["Category"], str(row["Current Qty"]), str(row["Base Price"]),
+             row["Published"], row["Examine Status"], row["url"], float(row["進貨價"]), updated_at)
+            for row in df_products.to_dict("records")
+        ]
+        with closing(self.connect()) as conn, conn:
+            conn.executemany("""
+                INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user, name) DO UPDATE SET
+                    category = excluded.category, current_qty = excluded.current_qty,
+                    base_price = excluded.base_price, published = excluded.published,
+                    examine_status = excluded.examine_status, url = excluded.url,
+                    updated_at = excluded.updated_at
+            """, rows)
+        return len(rows)
+
+    def save_product_fields(self, user, df_products, columns):
+        """
+        寫入使用者在產品目錄中編輯的欄位（url、進貨價），目錄中沒有的欄位略過；
+        資料庫還沒有該產品時新增一列，其餘欄位留空。回傳寫入筆數。
+        """
+        fields = [(column, PRODUCT_STORE_FIELDS[column]) for column in columns
+                  if column in PRODUCT_STORE_FIELDS and column in df_products.columns]
+        if "Name" not in df_products.columns or not fields:
+            return 0
+        updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = [
+            (user, str(row["Name"]).strip(),
+             *[None if pd.isna(row[column]) else row[column] for column, _ in fields], updated_at)
+            for row in df_products.to_dict("records")
+        ]
+        names = ", ".join(field for _, field in fields)
+        placeholders = ", ".join("?" for _ in fields)
+        updates = ", ".join(f"{field} = excluded.{field}" for _, field in fields)
+        with closing(self.connect()) as conn, conn:
+            conn.executemany(f"""
+                INSERT INTO products (user, name, {names}, updated_at) VALUES (?, ?, {placeholders}, ?)
+                ON CONFLICT (user, name) DO UPDATE SET {updates}, updated_at = excluded.updated_at
+            """, rows)
+        return len(rows)
+
+    def load_watermark(self, user, limit=WATERMARK_SIZE):
+        """
+        帳號的水位 Order Code（由新到舊）。只看 watermarks 表：orders 表可能含有依日期區間抓取的舊訂單，
+        不能代表已同步到哪裡。
+        """
+        with closing(self.connect()) as conn:
+            rows = conn.execute(
+                "SELECT order_code FROM watermarks WHERE user = ? ORDER BY order_code DESC LIMIT ?",
+                (user, limit),
+            ).fetchall()
+        return [order_code for (order_code,) in rows]
+
+    def save_watermark(self, user, order_codes, limit=WATERMARK_SIZE):
+        """加入本次看到的訂單編號，只保留最新的 limit 筆作為下次同步的水位"""
+        now = datetime.now()
+        recorded_at = now.strftime("%Y-%m-%d %H:%M:%S")
+        today = now.strftime("%Y-%m-%d")
+        rows = [(user, code, order_date_from_code(code, today), recorded_at)
+                for code in {str(code).strip() for code in order_codes if str(code).strip()}]
+        with closing(self.connect()) as conn, conn:
+            conn.executemany("INSERT OR IGNORE INTO watermarks VALUES (?, ?, ?, ?)", rows)
+            conn.execute("""
+                DELETE FROM watermarks WHERE user = ? AND order_code NOT IN (
+                    SELECT order_code FROM watermarks WHERE user = ? ORDER BY order_code DESC LIMIT ?)
+            """, (user, user, limit))
+
+    def has_order(self, order_code):
+        with closing(self.connect()) as conn:
+            row = conn.execute("SELECT 1 FROM orders WHERE order_code = ?", (str(order_code).strip(),)).fetchone()
+        return row is not None
+
+    def revenue(self, user, start_date, end_date):
+        """指定帳號在 [start_date, end_date] 期間（YYYY-MM-DD）的 Final price 總和"""
+        with closing(self.connect()) as conn:
+            (total,) = conn.execute(
+                "SELECT COALESCE(SUM(final_price), 0) FROM orders WHERE user = ? AND order_date BETWEEN ? AND ?",
+                (user, start_date, end_date),
+            ).fetchone()
+        return round(total, 2)
+
+
+# ===============================
+# 訂單 Parquet 快照（依帳號、日期分區）
+# ===============================
+# order_snapshots/user=<帳號>/date=<YYYY-MM-DD>/part-<抓取時間>.parquet
+ORDER_SNAPSHOT_DIR = "order_snapshots"
+
+
+def write_order_snapshot(snapshot_dir, user, df_orders):
+    """
+    將一次抓取的訂單依下單日期分區寫成 Parquet，回傳寫入的檔案數。
+    每次抓取各寫新檔，不改寫舊檔；同一 Order Code 讀取時以最新抓取為準。
+    """
+    pa = load_pyarrow()
+    if pa is None or df_orders.empty:
+        return 0
+    now = datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    snapshot = pd.DataFrame({
+        "#": df_orders["#"].fillna("").astype(str),
+        "Order Code": df_orders["Order Code"].astype(str).str.strip(),
+        "Num. of Products": df_orders["Num. of Products"].astype("int64"),
+        "Customer": df_orders["Customer"].fillna("").astype(str),
+        "Amount": df_orders["Amount"].astype("float64"),
+        "Service charge": df_orders["Service charge"].astype("float64"),
+        "Final price": df_orders["Final price"].astype("float64"),
+        "Delivery Status": df_orders["Delivery Status"].fillna("").astype(str),
+        "Payment Status": df_orders["Payment Status"].fillna("").astype(str),
+        "Product Info": df_orders["Product Info"].fillna("").astype(str),
+        "Options": df_orders["Options"].fillna("").astype(str),
+        "scraped_at": now.strftime("%Y-%m-%d %H:%M:%S.%f"),
+    })
+    order_dates = snapshot["Order Code"].map(lambda code: order_date_from_code(code, today))
+    file_name = f"part-{now.strftime('%Y%m%d%H%M%S%f')}.parquet"
+    written = 0
+    for order_date, part in snapshot.groupby(order_dates):
+        part_dir = os.path.join(snapshot_dir, f"user={user}", f"date={order_date}")
+        os.makedirs(part_dir, exist_ok=True)
+        pa.parquet.write_table(pa.Table.from_pandas(part, preserve_index=False), os.path.join(part_dir, file_name))
+        written += 1
+    return written
+
+
+def load_order_snapshots(snapshot_dir, user=None, start_date=None, end_date=None):
+    """
+    以 memory map 讀取快照，只掃描符合帳號與日期範圍（YYYY-MM-DD，含頭尾）的分區。
+    回傳欄位為 ORDER_COLUMNS 加上 user、date，依 Order Code 由新到舊排序。
+    """
+    columns = ORDER_COLUMNS + ["user", "date"]
+    pa = load_pyarrow()
+    if pa is None or not os.path.isdir(snapshot_dir):
+        return pd.DataFrame(columns=columns)
+    filters = []
+    if user:
+        filters.append(("user", "=", user))
+    if start_date:
+        filters.append(("date", ">=", start_date))
+    if end_date:
+        filters.append(("date", "<=", end_date))
+    partitioning = pa.dataset.partitioning(
+        pa.schema([("user", pa.string()), ("date", pa.string())]), flavor="hive")
+    table = pa.parquet.read_table(snapshot_dir, filters=filters or None, memory_map=True, partitioning=partitioning)
+    df = table.to_pandas()
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    df = df.sort_values("scraped_at").drop_duplicates("Order Code", keep="last")
+    return df.sort_values("Order Code", ascending=False)[columns].reset_index(drop=True)
+
 
 class DialogWindow(QWidget):
     def __init__(self):
@@ -110,58 +1745,212 @@ class OrderRangeDialog(QDialog):
 # ===============================
 # 輔助對話框：更新產品 URL
 # ===============================
+class ProductTableModel(QAbstractTableModel):
+    """
+    直接以產品目錄 DataFrame 為資料來源的表格模型，畫面只會向模型要看得到的列，
+    不必為每一列建立元件。URL 與進貨價可編輯，修改直接寫回 DataFrame，並記錄改過的列。
+    """
+    NAME_COLUMN, URL_COLUMN, PRICE_COLUMN, LINK_COLUMN = range(4)
+    HEADERS = ["產品名稱", "URL", "進貨價", "操作"]
+    EDITABLE_FIELDS = ["url", "進貨價"]
+    DIRTY_BACKGROUND = QColor(255, 243, 205)
+
+    def __init__(self, df_products, parent=None):
+        super().__init__(parent)
+        self.df_products = df_products
+        self.dirty_rows = set()
+        self.categories = (df_products["Category"].fillna("").astype(str).tolist()
+                           if "Category" in df_products.columns else [""] * len(df_products))
+        self.frame_columns = {
+            self.NAME_COLUMN: df_products.columns.get_loc("Name"),
+            self.URL_COLUMN: df_products.columns.get_loc("url"),
+            self.PRICE_COLUMN: df_products.columns.get_loc("進貨價"),
+        }
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.df_products)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def value(self, row, column):
+        return self.df_products.iat[row, self.frame_columns[column]]
+
+    def name(self, row):
+        name = self.value(row, self.NAME_COLUMN)
+        return "" if pd.isna(name) else str(name)
+
+    def url(self, row):
+        url = self.value(row, self.URL_COLUMN)
+        return "" if pd.isna(url) else str(url)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+        if column == self.LINK_COLUMN:
+            return "開啟連結" if role == Qt.DisplayRole else None
+        if role in (Qt.DisplayRole, Qt.EditRole, Qt.ToolTipRole):
+            value = self.value(row, column)
+            return "" if pd.isna(value) else str(value)
+        if role == Qt.TextAlignmentRole and column == self.PRICE_COLUMN:
+            return Qt.AlignRight | Qt.AlignVCenter
+        if role == Qt.BackgroundRole and row in self.dirty_rows:
+            return self.DIRTY_BACKGROUND
+        return None
+
+    def flags(self, index):
+        flags = Qt.ItemIsSelectable | Qt.ItemIsEnabled
+        if index.column() in (self.URL_COLUMN, self.PRICE_COLUMN):
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or not (self.flags(index) & Qt.ItemIsEditable):
+            return False
+        row, column = index.row(), index.column()
+        if column == self.PRICE_COLUMN:
+            value = pd.to_numeric(value, errors="coerce")
+        # 內容沒有實際改變（例如只是進入再離開編輯）時不標記為未儲存
+        if self.data(index, Qt.EditRole) == ("" if pd.isna(value) else str(value)):
+            return False
+        self.df_products.iat[row, self.frame_columns[column]] = value
+        self.dirty_rows.add(row)
+        self.dataChanged.emit(self.index(row, 0), self.index(row, self.LINK_COLUMN - 1))
+        return True
+
+    def mark_clean(self):
+        rows = self.dirty_rows
+        self.dirty_rows = set()
+        for row in rows:
+            self.dataChanged.emit(self.index(row, 0), self.index(row, self.LINK_COLUMN - 1))
+
+
+class ProductFilterProxyModel(QSortFilterProxyModel):
+    """依產品名稱關鍵字與分類篩選，輸入時即時更新"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.keyword = ""
+        self.category = ""
+
+    def set_keyword(self, keyword):
+        self.keyword = keyword.strip().lower()
+        self.invalidateFilter()
+
+    def set_category(self, category):
+        self.category = category
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        model = self.sourceModel()
+        if self.category and model.categories[source_row] != self.category:
+            return False
+        return not self.keyword or self.keyword in model.name(source_row).lower()
+
+
+class PriceDelegate(QStyledItemDelegate):
+    """進貨價編輯器：只在編輯中的儲存格建立 QLineEdit"""
+
+    def createEditor(self, parent, option, index):
+        editor = QLineEdit(parent)
+        editor.setAlignment(Qt.AlignRight)
+        editor.setValidator(QDoubleValidator(0.99, 99.99, 2))
+        return editor
+
+    def setEditorData(self, editor, index):
+        editor.setText(index.data(Qt.EditRole))
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.text(), Qt.EditRole)
+
+
+class LinkButtonDelegate(QStyledItemDelegate):
+    """將「開啟連結」畫成按鈕，點擊時以瀏覽器開啟該列 URL"""
+
+    def paint(self, painter, option, index):
+        button = QStyleOptionButton()
+        button.rect = option.rect
+        button.text = index.data(Qt.DisplayRole)
+        button.state = QStyle.State_Enabled
+        QApplication.style().drawControl(QStyle.CE_PushButton, button, painter)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            # 畫面上的模型是篩選用的 proxy，要換回來源模型的列才是該產品
+            source = model.mapToSource(index)
+            QDesktopServices.openUrl(QUrl(model.sourceModel().url(source.row())))
+            return True
+        return False
+
+
 class UpdateProductURLDialog(QDialog):
-    def __init__(self, products_file, parent=None):
+    ALL_CATEGORIES = "全部分類"
+
+    def __init__(self, catalog, order_store=None, parent=None):
         super().__init__(parent)
         self.setWindowTitle("更新產品 URL")
         self.resize(800, 600)
-        self.products_file = products_file
-        self.df_products = pd.read_excel(products_file)
-        # 如果沒有 url 欄位就新增
+        self.catalog = catalog
+        self.order_store = order_store
+        self.df_products = catalog.frame()
+        self.file_key = catalog.file_key
+        # 如果沒有 url 或進貨價欄位就新增
         if "url" not in self.df_products.columns:
             self.df_products["url"] = ""
+        if "進貨價" not in self.df_products.columns:
+            self.df_products["進貨價"] = 0.0
+        self.df_products["url"] = self.df_products["url"].astype(object)
+        # 統一成 float，整數欄位（int64）寫入小數時才不會觸發 pandas 型別警告；
+        # 空白保留為 NaN，只改 URL 的產品存檔時不會被寫成進貨價 0
+        self.df_products["進貨價"] = pd.to_numeric(self.df_products["進貨價"], errors="coerce").astype(float)
         self.initUI()
 
     def initUI(self):
         layout = QVBoxLayout()
-        self.table = QTableWidget(self)
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(["產品名稱", "URL", "進貨價", "操作"])
-        # self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.table.setColumnWidth(0, 250)  # 調整 "操作" 欄的寬度
-        self.table.setColumnWidth(1, 300)  # 調整 "操作" 欄的寬度
-        self.table.setColumnWidth(2, 100)  # 調整 "操作" 欄的寬度
-        # self.table.setColumnWidth(3, 40)  # 調整 "操作" 欄的寬度
+        self.model = ProductTableModel(self.df_products, self)
+        self.proxy = ProductFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+        self.model.dataChanged.connect(self.update_status)
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("搜尋："))
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("輸入產品名稱關鍵字")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.textChanged.connect(self.apply_filter)
+        filter_layout.addWidget(self.search_edit)
+        filter_layout.addWidget(QLabel("分類："))
+        self.category_combo = QComboBox()
+        self.category_combo.addItem(self.ALL_CATEGORIES)
+        self.category_combo.addItems(sorted(set(self.model.categories) - {""}))
+        self.category_combo.currentTextChanged.connect(self.apply_filter)
+        filter_layout.addWidget(self.category_combo)
+        layout.addLayout(filter_layout)
+
+        self.table = QTableView(self)
+        self.table.setModel(self.proxy)
+        self.price_delegate = PriceDelegate(self.table)
+        self.link_delegate = LinkButtonDelegate(self.table)
+        self.table.setItemDelegateForColumn(ProductTableModel.PRICE_COLUMN, self.price_delegate)
+        self.table.setItemDelegateForColumn(ProductTableModel.LINK_COLUMN, self.link_delegate)
+        self.table.setColumnWidth(ProductTableModel.NAME_COLUMN, 250)
+        self.table.setColumnWidth(ProductTableModel.URL_COLUMN, 300)
+        self.table.setColumnWidth(ProductTableModel.PRICE_COLUMN, 100)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
         self.table.horizontalHeader().setStretchLastSection(True)
-        self.table.setRowCount(len(self.df_products))
-
-        for row in range(len(self.df_products)):
-            product_name = str(self.df_products.iloc[row].get("Name", ""))
-            url = str(self.df_products.iloc[row].get("url", ""))
-            unit_price = str(self.df_products.iloc[row].get("進貨價", "0"))
-
-            name_item = QTableWidgetItem(product_name)
-            name_item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEnabled)
-            name_item.setToolTip(product_name)
-            self.table.setItem(row, 0, name_item)
-
-            url_item = QTableWidgetItem(url)
-            url_item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEnabled)
-            url_item.setToolTip(url)
-            self.table.setItem(row, 1, url_item)
-
-            price_item = QLineEdit()
-            price_item .setAlignment(Qt.AlignRight)  # Align text to the center
-            price_item.setValidator(QDoubleValidator(0.99, 99.99, 2))
-            price_item.setText(str(unit_price))  # Set the initial value
-            self.table.setCellWidget(row, 2, price_item)
-            self.table.setItem(row, 1, QTableWidgetItem(str(self.df_products.iloc[row].get("url", ""))))
-            btn = QPushButton("開啟連結")
-            btn.clicked.connect(lambda _, url=url: QDesktopServices.openUrl(QUrl(url)))
-            self.table.setCellWidget(row, 3, btn)
-
+        # 每列高度固定，捲動時不必逐列計算
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.setEditTriggers(QTableView.DoubleClicked | QTableView.EditKeyPressed | QTableView.AnyKeyPressed)
         layout.addWidget(self.table)
+
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
         btn_layout = QHBoxLayout()
         save_btn = QPushButton("儲存")
         cancel_btn = QPushButton("取消")
@@ -171,25 +1960,47 @@ class UpdateProductURLDialog(QDialog):
         btn_layout.addWidget(cancel_btn)
         layout.addLayout(btn_layout)
         self.setLayout(layout)
+        self.update_status()
+
+    def apply_filter(self):
+        category = self.category_combo.currentText()
+        self.proxy.set_category("" if category == self.ALL_CATEGORIES else category)
+        self.proxy.set_keyword(self.search_edit.text())
+        self.update_status()
+
+    def update_status(self):
+        self.status_label.setText(f"顯示 {self.proxy.rowCount()} / {self.model.rowCount()} 項，"
+                                  f"未儲存 {len(self.model.dirty_rows)} 項")
 
     def save_data(self):
-        urls = []
-        unit_prices = []
-        for row in range(self.table.rowCount()):
-            url_item = self.table.item(row, 1)
-            urls.append(url_item.text() if url_item is not None else "")
-            price_widget = self.table.cellWidget(row, 2)
-            unit_prices.append(price_widget.text() if price_widget is not None else "")
-        self.df_products["url"] = urls
-        # self.df_products["進貨價"] = unit_prices
-        self.df_products["進貨價"] = pd.to_numeric(unit_prices, errors='coerce')
+        # 結束編輯中的儲存格，讓最後的輸入也寫回模型
+        self.table.setCurrentIndex(QModelIndex())
+        if not self.model.dirty_rows:
+            self.accept()
+            return
         try:
-            self.df_products.to_excel(self.products_file, index=False)
+            self.catalog.save_rows(self.df_products, sorted(self.model.dirty_rows),
+                                   ProductTableModel.EDITABLE_FIELDS, self.file_key, self.order_store)
+            self.model.mark_clean()
             QMessageBox.information(self, "提示", "產品 URL 和 進貨價 已更新！")
             self.accept()
+        except ProductStoreError as e:
+            # 檔案已經存好，不要讓使用者以為修改沒有儲存
+            self.model.mark_clean()
+            QMessageBox.warning(self, "警告", str(e))
+            self.accept()
         except Exception as e:
             QMessageBox.critical(self, "錯誤", f"儲存產品 URL 和 進貨價  時發生錯誤：{e}")
 
+    def reject(self):
+        if self.model.dirty_rows:
+            reply = QMessageBox.question(self, "確認", f"有 {len(self.model.dirty_rows)} 項修改尚未儲存，確定要放棄嗎？",
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes:
+                return
+        super().reject()
+
+
 # ===============================
 # 逐筆出貨對話框
 # ===============================
@@ -301,6 +2112,460 @@ class ShippingDialog(QDialog):
         QApplication.processEvents()  # 立即更新按鈕文字
 
 
+# ===============================
+# Google 憑證與用戶端
+# ===============================
+GOOGLE_SCOPES = [
+    "https://www.googleapis.com/auth/drive",
+    "https://www.googleapis.com/auth/spreadsheets"
+]
+GOOGLE_TOKEN_FILE = "token.json"
+GOOGLE_CLIENT_SECRETS_FILE = "credentials.json"
+TOKEN_REFRESH_MARGIN = 5 * 60  # 到期前幾秒在背景更新 token
+
+
+class GoogleCredentialManager:
+    """
+    整個程式共用的 Google 憑證：token.json 只讀一次，到期前在背景更新，
+    Drive 與 gspread 用戶端建立一次後重複使用，保留已建立的 HTTP 連線。
+    所有 Google API 呼叫都交給 executor 這條長駐執行緒依序執行（Drive 用戶端底層的 httplib2
+    不是執行緒安全的），用戶端因此只需要一份。
+    """
+
+    def __init__(self, token_file=GOOGLE_TOKEN_FILE, client_secrets_file=GOOGLE_CLIENT_SECRETS_FILE,
+                 scopes=GOOGLE_SCOPES):
+        self.token_file = token_file
+        self.client_secrets_file = client_secrets_file
+        self.scopes = scopes
+        self.creds = None
+        self.lock = threading.RLock()
+        self.refresh_timer = None
+        self.gspread = None
+        self.drive = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="google")
+
+    def credentials(self):
+        """回傳有效的憑證；token 失效時先嘗試以 refresh token 更新，仍不行才開瀏覽器重新授權"""
+        with self.lock:
+            if self.creds is None and os.path.exists(self.token_file):
+                from google.oauth2.credentials import Credentials
+                self.creds = Credentials.from_authorized_user_file(self.token_file, self.scopes)
+                if self.creds.valid:
+                    self.schedule_refresh()  # token 還有效時也要排定到期前的更新
+            if self.creds is None or not self.creds.valid:
+                if not (self.creds and self.creds.refresh_token and self.refresh()):
+                    self.authorize()
+            return self.creds
+
+    def authorize(self):
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        flow = InstalledAppFlow.from_client_secrets_file(self.client_secrets_file, self.scopes)
+        self.creds = flow.run_local_server(port=8080)
+        # 換了新的憑證物件，舊的用戶端要重建
+        self.gspread = None
+        self.drive = None
+        self.save()
+
+    def refresh(self):
+        """更新 access token（原物件就地更新，已建立的用戶端不必重建），回傳是否成功"""
+        from google.auth.exceptions import RefreshError
+        from google.auth.transport.requests import Request
+        with self.lock:
+            try:
+                self.creds.refresh(Request())
+            except RefreshError:
+                print(f"更新 Google token 失敗：{traceback.format_exc()}")
+                return False
+            self.save()
+            return True
+
+    def save(self):
+        with open(self.token_file, "w") as token:
+            token.write(self.creds.to_json())
+        self.schedule_refresh()
+
+    def schedule_refresh(self):
+        if self.refresh_timer is not None:
+            self.refresh_timer.cancel()
+        if self.creds.expiry is None or not self.creds.refresh_token:
+            return
+        delay = (self.creds.expiry - datetime.utcnow()).total_seconds() - TOKEN_REFRESH_MARGIN
+        self.refresh_timer = threading.Timer(max(delay, 0), self.queue_refresh)
+        self.refresh_timer.daemon = True
+        self.refresh_timer.start()
+
+    def queue_refresh(self):
+        """到期前的更新也排進 executor，不與進行中的 API 呼叫同時使用憑證"""
+        try:
+            self.executor.submit(self.refresh_in_background)
+        except RuntimeError:
+            pass  # 程式結束中，executor 已關閉
+
+    def refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            print(f"背景更新 Google token 時出錯：{traceback.format_exc()}")  # 下次使用時會再更新
+
+    def drive_service(self):
+        creds = self.credentials()
+        with self.lock:
+            if self.drive is None:
+                import httplib2
+                from google_auth_httplib2 import AuthorizedHttp
+                from googleapiclient.discovery import build
+                http = AuthorizedHttp(creds, http=httplib2.Http(timeout=60))
+                self.drive = build("drive", "v3", http=http, cache_discovery=False)
+            return self.drive
+
+    def gspread_client(self):
+        creds = self.credentials()
+        with self.lock:
+            if self.gspread is None:
+                import gspread
+                self.gspread = gspread.authorize(creds)
+            return self.gspread
+
+    def shutdown(self):
+        """取消還沒開始的 Google 工作，等待進行中的一個完成，避免寫到一半被中斷"""
+        if self.refresh_timer is not None:
+            self.refresh_timer.cancel()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+google_credentials = GoogleCredentialManager()
+
+
+class GoogleTaskRunner(QObject):
+    """
+    把 Google 工作交給 google_credentials.executor，完成後在 GUI 執行緒呼叫 on_done(結果)，
+    出錯時呼叫 on_error(traceback 字串)。
+    """
+    task_done = pyqtSignal(object, object)
+    task_failed = pyqtSignal(object, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.task_done.connect(self.on_task_done)
+        self.task_failed.connect(self.on_task_failed)
+
+    def submit(self, func, on_done=None, on_error=None):
+        def run():
+            try:
+                result = func()
+            except Exception:
+                self.task_failed.emit(on_error, traceback.format_exc())
+                return
+            self.task_done.emit(on_done, result)
+        return google_credentials.executor.submit(run)
+
+    def on_task_done(self, callback, result):
+        if callback is not None:
+            callback(result)
+
+    def on_task_failed(self, callback, error):
+        if callback is not None:
+            callback(error)
+        else:
+            print(f"Google 工作出錯：{error}")
+
+
+# ===============================
+# Google 雲端資料夾對照快取
+# ===============================
+DRIVE_APP_FOLDER = "APPDATA-GoshopHSN"
+DRIVE_FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+DRIVE_FOLDER_CACHE_FILE = "drive_folders.json"
+DRIVE_FOLDER_CACHE_TTL = 6 * 60 * 60  # 秒
+
+
+def list_drive_folders(drive_service, query):
+    """列出符合條件的所有資料夾（自動翻頁），回傳 名稱 -> ID，同名時保留第一個"""
+    folders = {}
+    page_token = None
+    while True:
+        result = drive_service.files().list(
+            q=f"mimeType='{DRIVE_FOLDER_MIME_TYPE}' and trashed=false and {query}",
+            fields="nextPageToken, files(id, name)",
+            pageSize=1000,
+            pageToken=page_token,
+        ).execute()
+        for folder in result.get("files", []):
+            folders.setdefault(folder["name"], folder["id"])
+        page_token = result.get("nextPageToken")
+        if not page_token:
+            return folders
+
+
+class DriveFolderCache:
+    """
+    APPDATA-GoshopHSN 底下各帳號資料夾的 名稱 -> ID 對照，存在磁碟上。
+    一次查詢列出所有子資料夾；在 ttl 內且所有帳號都找得到時不必登入或連線。
+    快取只記錄存在的資料夾，有帳號查不到時一律重新查詢，新建立的資料夾不會被舊快取擋掉。
+    """
+
+    def __init__(self, cache_file, ttl=DRIVE_FOLDER_CACHE_TTL):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.parent_id = None
+        self.folders = {}
+        self.fetched_at = 0
+        self.lock = threading.Lock()  # GUI 執行緒與 Google 執行緒都會讀寫
+        self.load()
+
+    def load(self):
+        try:
+            with self.lock, open(self.cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.parent_id = data["parent_id"]
+            self.folders = data["folders"]
+            self.fetched_at = data["fetched_at"]
+        except (OSError, ValueError, KeyError):
+            pass  # 快取不存在或損毀時重新查詢
+
+    def save(self):
+        def write(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"parent_id": self.parent_id, "folders": self.folders, "fetched_at": self.fetched_at},
+                          f, ensure_ascii=False, indent=2)
+        replace_file_atomically(self.cache_file, write)
+
+    def is_fresh(self):
+        return self.parent_id is not None and time.time() - self.fetched_at < self.ttl
+
+    def missing(self, users):
+        return [user for user in users if user not in self.folders]
+
+    def refresh(self, drive_service):
+        parents = list_drive_folders(drive_service, f"name='{DRIVE_APP_FOLDER}' and 'root' in parents")
+        parent_id = parents.get(DRIVE_APP_FOLDER)
+        folders = list_drive_folders(drive_service, f"'{parent_id}' in parents") if parent_id else {}
+        with self.lock:
+            self.parent_id, self.folders, self.fetched_at = parent_id, folders, time.time()
+            self.save()
+
+
+# ===============================
+# 銷售資料同步到 Google 試算表
+# ===============================
+SALES_SHEET_TITLE = "goshop_sales"
+SALES_SHEET_STATE_FILE = "sales_sheet_state.json"
+SALES_SHEET_COLUMNS = ["檔案名", "revenue"]
+
+
+def sales_sheet_grid(ledger):
+    """試算表內容：標題列、每個訂單檔一列，最後一列為總收入"""
+    rows = [SALES_SHEET_COLUMNS]
+    rows += [[file_name, entry["revenue"]] for file_name, entry in sorted(ledger.entries.items())]
+    rows.append(["總收入", ledger.total_revenue()])
+    return rows
+
+
+def diff_sheet_ranges(old_grid, new_grid, width=len(SALES_SHEET_COLUMNS)):
+    """
+    比對上次寫入與這次的內容，回傳 values:batchUpdate 的 data。
+    連續變動的列合併成一個範圍；新內容比舊內容短時，多出來的舊列以空白覆蓋。
+    """
+    blank = [""] * width
+    last_column = chr(ord("A") + width - 1)
+    data = []
+    start = None
+    for i in range(max(len(old_grid), len(new_grid)) + 1):
+        old_row = old_grid[i] if i < len(old_grid) else None
+        new_row = new_grid[i] if i < len(new_grid) else (blank if old_row is not None else None)
+        changed = new_row is not None and new_row != old_row
+        if changed and start is None:
+            start = i
+        elif not changed and start is not None:
+            values = [new_grid[j] if j < len(new_grid) else blank for j in range(start, i)]
+            data.append({"range": f"A{start + 1}:{last_column}{i}", "values": values})
+            start = None
+    return data
+
+
+class SalesSheetSync:
+    """
+    將銷售帳本同步到使用者雲端資料夾中的 goshop_sales 試算表。
+    記住上次寫入的試算表 ID 與內容，只送出變動的範圍，每次同步最多一個 values:batchUpdate 請求。
+    client 為 gspread.Client，或離線測試用的 sheets_stub.SheetsStub。
+    """
+
+    def __init__(self, user_dir):
+        self.state_file = os.path.join(user_dir, SALES_SHEET_STATE_FILE)
+        self.state = self.load()
+
+    def load(self):
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}  # 狀態不存在或損毀時整張重寫
+
+    def save(self):
+        def write(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=2)
+        replace_file_atomically(self.state_file, write)
+
+    def spreadsheet_id(self, client, folder_id):
+        """找出或建立資料夾中的試算表；已記住 ID 時不必查詢"""
+        if self.state.get("folder_id") == folder_id and self.state.get("spreadsheet_id"):
+            return self.state["spreadsheet_id"]
+        files = client.list_spreadsheet_files(title=SALES_SHEET_TITLE, folder_id=folder_id)
+        spreadsheet_id = files[0]["id"] if files else client.create(SALES_SHEET_TITLE, folder_id=folder_id).id
+        self.state = {"folder_id": folder_id, "spreadsheet_id": spreadsheet_id, "rows": []}
+        return spreadsheet_id
+
+    def push(self, client, folder_id, grid):
+        """
+        同步內容，回傳送出的範圍數（沒有變動時為 0，不發出請求）。
+        不知道試算表原本內容（整張重寫）時，另外清除新內容最後一列以下的舊資料。
+        """
+        spreadsheet_id = self.spreadsheet_id(client, folder_id)
+        old_grid = self.state.get("rows", [])
+        data = diff_sheet_ranges(old_grid, grid)
+        if data:
+            try:
+                if not old_grid:
+                    last_column = chr(ord("A") + len(SALES_SHEET_COLUMNS) - 1)
+                    client.http_client.values_batch_clear(
+                        spreadsheet_id, body={"ranges": [f"A{len(grid) + 1}:{last_column}"]})
+                client.http_client.values_batch_update(
+                    spreadsheet_id, body={"valueInputOption": "RAW", "data": data})
+            except Exception:
+                # 不確定寫入了多少，下次重新確認試算表並整張重寫
+                self.state = {}
+                self.save()
+                raise
+        self.state["rows"] = grid
+        self.save()
+        return len(data)
+
+
+# ===============================
+# 雲端同步水位（多台電腦共用）
+# ===============================
+DRIVE_WATERMARK_FILE = "lastorder.txt"
+WATERMARK_REPLICA_FILE = "watermark_replica.json"
+WATERMARK_REPLICA_TTL = 10 * 60  # 秒，快取在此時間內直接使用，不連線確認
+WATERMARK_PUSH_ATTEMPTS = 3
+WATERMARK_REPLICA_LOCK = threading.Lock()  # 各帳號的 watermark_replica.json 讀寫
+
+
+def merge_watermark_codes(*code_lists, limit=WATERMARK_SIZE):
+    """合併多份水位，只保留最新的 limit 筆（由新到舊）"""
+    codes = {str(code).strip() for code_list in code_lists for code in code_list if str(code).strip()}
+    return sorted(codes, reverse=True)[:limit]
+
+
+class ReplicatedWatermark:
+    """
+    存在使用者雲端資料夾 lastorder.txt 的同步水位（每行一個 Order Code，由新到舊），本機快取於
+    watermark_replica.json。水位是「看過的最新訂單」集合，多台電腦同時寫入時以聯集合併即可：
+    寫入前記下 headRevisionId，寫入後檢查 revisions，若中間有別台電腦寫入的版本，取回合併後再寫一次。
+    """
+
+    def __init__(self, user_dir):
+        self.cache_file = os.path.join(user_dir, WATERMARK_REPLICA_FILE)
+        self.file_id = None
+        self.revision = None
+        self.codes = []
+        self.checked_at = 0
+        self.load()
+
+    def load(self):
+        try:
+            with WATERMARK_REPLICA_LOCK, open(self.cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.file_id = data["file_id"]
+            self.revision = data["revision"]
+            self.codes = data["codes"]
+            self.checked_at = data["checked_at"]
+        except (OSError, ValueError, KeyError):
+            pass  # 快取不存在或損毀時重新讀取
+
+    def save(self):
+        def write(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"file_id": self.file_id, "revision": self.revision, "codes": self.codes,
+                           "checked_at": self.checked_at}, f, ensure_ascii=False, indent=2)
+        with WATERMARK_REPLICA_LOCK:
+            replace_file_atomically(self.cache_file, write)
+
+    def is_fresh(self):
+        return time.time() - self.checked_at < WATERMARK_REPLICA_TTL
+
+    def download(self, drive_service, file_id, revision_id=None):
+        if revision_id:
+            request = drive_service.revisions().get_media(fileId=file_id, revisionId=revision_id)
+        else:
+            request = drive_service.files().get_media(fileId=file_id)
+        return merge_watermark_codes(request.execute().decode("utf-8").splitlines())
+
+    def pull(self, drive_service, folder_id):
+        """
+        讀取雲端水位。只查詢一次檔案資訊，revision 與快取相同時不下載內容。
+        兩台電腦同時第一次建立而出現多個 lastorder.txt 時，以最早建立的為準並合併其他檔案的內容。
+        """
+        files = drive_service.files().list(
+            q=f"name='{DRIVE_WATERMARK_FILE}' and '{folder_id}' in parents and trashed=false",
+            fields="files(id, headRevisionId)",
+            orderBy="createdTime",
+        ).execute().get("files", [])
+        if not files:
+            self.file_id, self.revision, self.codes = None, None, []
+        else:
+            head = files[0]
+            if head["id"] != self.file_id or head["headRevisionId"] != self.revision:
+                self.codes = self.download(drive_service, head["id"])
+            self.file_id, self.revision = head["id"], head["headRevisionId"]
+            if len(files) > 1:
+                extra = [self.download(drive_service, file["id"]) for file in files[1:]]
+                self.codes = merge_watermark_codes(self.codes, *extra)
+        self.checked_at = time.time()
+        self.save()
+        return self.codes
+
+    def missed_codes(self, drive_service, base_revision, own_revision):
+        """本次寫入與讀取時的版本之間，其他電腦寫入的水位"""
+        revisions = drive_service.revisions().list(
+            fileId=self.file_id, fields="revisions(id)").execute().get("revisions", [])
+        revision_ids = [revision["id"] for revision in revisions]
+        if own_revision not in revision_ids:
+            return []
+        end = revision_ids.index(own_revision)
+        # 讀取時的版本已被 Drive 合併或清除時，至少取回寫入前的最後一個版本
+        start = revision_ids.index(base_revision) + 1 if base_revision in revision_ids else max(end - 1, 0)
+        return merge_watermark_codes(*[self.download(drive_service, self.file_id, revision_id)
+                                       for revision_id in revision_ids[start:end]])
+
+    def push(self, drive_service, folder_id, codes):
+        """把本機水位併入雲端水位，回傳合併後的水位；雲端已涵蓋時不寫入"""
+        from googleapiclient.http import MediaInMemoryUpload
+        for _ in range(WATERMARK_PUSH_ATTEMPTS):
+            self.pull(drive_service, folder_id)
+            base_revision = self.revision
+            merged = merge_watermark_codes(self.codes, codes)
+            if merged == self.codes:
+                return self.codes
+            media = MediaInMemoryUpload(("\n".join(merged) + "\n").encode("utf-8"), mimetype="text/plain")
+            if self.file_id:
+                result = drive_service.files().update(
+                    fileId=self.file_id, media_body=media, fields="id, headRevisionId").execute()
+            else:
+                result = drive_service.files().create(
+                    body={"name": DRIVE_WATERMARK_FILE, "parents": [folder_id]},
+                    media_body=media, fields="id, headRevisionId").execute()
+            self.file_id, self.revision, self.codes = result["id"], result["headRevisionId"], merged
+            self.checked_at = time.time()
+            self.save()
+            missed = self.missed_codes(drive_service, base_revision, self.revision) if base_revision else []
+            if merge_watermark_codes(merged, missed) == merged:
+                return merged
+            codes = merge_watermark_codes(merged, missed)  # 別台電腦的寫入被覆蓋，合併後重寫
+        raise RuntimeError(f"雲端水位持續有其他電腦同時寫入，已重試 {WATERMARK_PUSH_ATTEMPTS} 次")
+
+
 # ===============================
 # 主應用程式
 # ===============================
@@ -317,95 +2582,147 @@ class OrderScraperApp(QWidget):
         self.base_dir = os.getcwd()  # users.xlsx 存放於此
         self.users_file = os.path.join(self.base_dir, "users.xlsx")
         self.current_user_dir = None  # 其他資料檔存放於各使用者目錄下
-        self.playwright = None
-        self.browser = None
+        self.order_store = OrderStore(os.path.join(self.base_dir, ORDER_STORE_FILE))  # 所有帳號的訂單資料庫
+        self.drive_folders = DriveFolderCache(os.path.join(self.base_dir, DRIVE_FOLDER_CACHE_FILE))
+        self.engine = BrowserEngine()  # 整個程式共用的 Playwright 與瀏覽器
         self.page = None
+        # 背景抓取執行緒，進度與結果透過 signal 回到 GUI 執行緒
+        self.scrape_worker = ScrapeWorker()
+        self.scrape_worker.log_message.connect(self.log)
+        self.scrape_worker.page_scraped.connect(self.on_page_scraped)
+        self.scrape_worker.task_finished.connect(self.on_task_finished)
+        self.scrape_worker.task_failed.connect(self.on_task_failed)
+        self.scrape_worker.task_cancelled.connect(self.on_task_cancelled)
+        self.running_tasks = {}  # task_id -> 工作名稱
+        self.cart_batch_message = ""  # 批次加入購物車的出貨訊息，失敗項目改逐筆出貨時沿用
+        self.sync_all_results = {}  # 全部帳號同步中：task_id -> 帳號結果摘要（None 代表尚未完成）
+        self.sync_all_skipped = []  # 全部帳號同步時略過的帳號與原因
         self.df_orders = None  # 儲存訂單資料
 
+        self.google_tasks = GoogleTaskRunner(self)  # Google API 呼叫都在同一條背景執行緒依序執行
+        self.access_locked_widgets = []  # 權限確認前暫停使用的按鈕
+
         if not os.path.exists(self.users_file):
             self.disable_buttons()
             self.log("尚未建立 users.xlsx，請先新增使用者。")
         else:
             self.df_users = self.load_users()
+            # 視窗先顯示，Google 登入與雲端資料夾檢查在背景進行
+            QTimer.singleShot(0, self.start_google_access_check)
+        QTimer.singleShot(0, self.read_sales_data)
 
-        # Check Google Sheets access
-        self.check_google_sheets_access(self.df_users)
-        self.read_sales_data()
+    # -------------------------------
+    # Google 雲端權限
+    # -------------------------------
+    def start_google_access_check(self):
+        self.access_locked_widgets = [
+            widget for widget in (self.add_user_btn, self.open_browser_btn, self.scrape_orders_btn,
+                                  self.sync_all_btn, self.update_products_btn, self.scrape_by_order_range_btn,
+                                  self.select_order_btn)
+            if widget.isEnabled()
+        ]
+        for widget in self.access_locked_widgets:
+            widget.setEnabled(False)
+        self.access_status_label.setText("正在確認 Google 雲端權限...")
+        self.access_status_label.show()
+        self.access_progress.show()
+        users = list(self.df_users["user"])
+        self.google_tasks.submit(lambda: self.find_missing_user_folders(users),
+                                 self.on_google_access_checked, self.on_google_access_failed)
+
+    def finish_google_access_check(self):
+        self.access_progress.hide()
+        self.access_status_label.hide()
+
+    def on_google_access_checked(self, missing_users):
+        self.finish_google_access_check()
+        if missing_users:
+            self.deny_google_access(missing_users)
+            return
+        for widget in self.access_locked_widgets:
+            widget.setEnabled(True)
+        self.access_locked_widgets = []
+        self.log("Google 雲端權限確認完成。")
+        # 預先讀取各帳號的雲端水位，開始抓取時直接使用快取
+        accounts = [(user, os.path.join(self.base_dir, user)) for user in self.df_users["user"]
+                    if os.path.isdir(os.path.join(self.base_dir, user))]
+        self.start_watermark_replication(accounts)
+
+    def on_google_access_failed(self, error):
+        self.finish_google_access_check()
+        self.log(f"確認 Google 雲端權限時出錯：{error}")
+        QMessageBox.information(self, "錯誤", "無法確認 Google 雲端權限，請檢查網路連線後重新開啟程式。")
+        exit()
+
+    def deny_google_access(self, missing_users):
+        msg = "".join(f"{user}不存在\n" for user in missing_users)
+        QMessageBox.information(self, "錯誤", msg + "請洽管理人員")
+        exit()
 
     def check_google_sheets_access(self, df_users):
-        msg=""
-        membership = True
-        drive_service = self.get_drive_service()
-        # 1. 檢查父目錄 Goshophsn 是否存在
-        parent_query = (
-            "mimeType='application/vnd.google-apps.folder' "
-            "and name='APPDATA-GoshopHSN' "
-            "and 'root' in parents"
-        )
-        parent_result = drive_service.files().list(
-            q=parent_query,
-            fields="files(id, name)"
-        ).execute()
-        parent_folders = parent_result.get('files', [])
-        print("parent_folders ",parent_folders )
+        """同步確認（新增使用者時使用），缺少資料夾時結束程式；查詢一樣在 Google 執行緒中進行"""
+        missing_users = google_credentials.executor.submit(
+            self.find_missing_user_folders, list(df_users["user"])).result()
+        if missing_users:
+            self.deny_google_access(missing_users)
+
+    def find_missing_user_folders(self, users):
+        """
+        回傳在 APPDATA-GoshopHSN 下沒有資料夾的帳號；在 Google 執行緒中呼叫，不操作任何元件。
+        不論帳號數量，最多只查詢兩次（父目錄、所有子資料夾），快取有效時完全不連線。
+        """
+        users = list(users)
+        if self.drive_folders.is_fresh() and not self.drive_folders.missing(users):
+            print("使用快取的雲端資料夾對照")
+            return []
+        self.drive_folders.refresh(self.get_drive_service())
+        if self.drive_folders.parent_id is None:
+            print(f"父目錄 {DRIVE_APP_FOLDER} 不存在")
+        missing_users = self.drive_folders.missing(users)
+        for user in missing_users:
+            print(f"子目錄{user}不存在")
+        return missing_users
+
+    def user_folder_id(self, user):
+        """帳號在 APPDATA-GoshopHSN 下的資料夾 ID；快取中沒有時重新列出一次"""
+        if user not in self.drive_folders.folders:
+            self.drive_folders.refresh(self.get_drive_service())
+        if user not in self.drive_folders.folders:
+            raise RuntimeError(f"雲端資料夾 {DRIVE_APP_FOLDER}/{user} 不存在")
+        return self.drive_folders.folders[user]
 
-        if not parent_folders:
-            print("父目錄 Goshophsn 不存在")
+    # -------------------------------
+    # 銷售資料同步到試算表
+    # -------------------------------
+    def start_sales_sheet_sync(self, user_dir, grid):
+        """交給 Google 執行緒推送；同一帳號的多次同步依序執行，最後送出的是最新內容"""
+        user = os.path.basename(os.path.normpath(user_dir))
+        self.google_tasks.submit(functools.partial(self.push_sales_sheet, user, user_dir, grid),
+                                 functools.partial(self.on_sales_sheet_synced, user),
+                                 functools.partial(self.on_sales_sheet_failed, user))
+
+    def push_sales_sheet(self, user, user_dir, grid):
+        folder_id = self.user_folder_id(user)
+        return SalesSheetSync(user_dir).push(self.get_gspread_client(), folder_id, grid)
+
+    def on_sales_sheet_synced(self, user, ranges):
+        if ranges:
+            self.log(f"{user} 的銷售資料已同步到 Google 試算表（更新 {ranges} 個範圍）。")
         else:
-            print("父目錄 Goshophsn 存在")
-
-        for folder_name in df_users['user']:
-            # folder_name = self.df_users['user'][1]
-            sheet_name = "lastorder.txt"
-            # folder_name="Goshophsn/"+folder_name
-            # 取得父目錄 ID
-            parent_id = parent_folders[0]['id']
-            print("parent_id ",parent_id)
-
-            # 2. 檢查子目錄 folder_name 是否存在
-            child_query = (
-                f"mimeType='application/vnd.google-apps.folder' "
-                f"and name='{folder_name}' "
-                f"and '{parent_id}' in parents"
-            )
-            child_result = drive_service.files().list(
-                q=child_query,
-                fields="files(id, name)"
-            ).execute()
-            child_folders = child_result.get('files', [])
-            if not child_folders:
-                msg += f"{folder_name}不存在\n"
-                print(f"子目錄{folder_name}不存在")
-                membership = False
-            else:
-                print(f"父目錄{folder_name} 存在")
-            if not membership:
-                QMessageBox.information(self, "錯誤", msg+"請洽管理人員")
-                exit()
+            self.log(f"{user} 的 Google 試算表已是最新，不需更新。")
+
+    def on_sales_sheet_failed(self, user, error):
+        self.log(f"同步 {user} 的銷售資料到 Google 試算表時出錯：{error}")
 
     def authenticate(self):
-        SCOPES = [
-            "https://www.googleapis.com/auth/drive",
-            "https://www.googleapis.com/auth/spreadsheets"
-        ]
-        creds = None
-        if os.path.exists("token.json"):
-            creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-        if not creds or not creds.valid:
-            flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
-            creds = flow.run_local_server(port=8080)
-            with open("token.json", "w") as token:
-                token.write(creds.to_json())
-        return creds
+        return google_credentials.credentials()
 
     def get_drive_service(self):
-        creds = self.authenticate()
-        return build("drive", "v3", credentials=creds)
+        return google_credentials.drive_service()
 
     # 取得 Google Sheets 服務
     def get_gspread_client(self):
-        creds = self.authenticate()
-        return gspread.authorize(creds)
+        return google_credentials.gspread_client()
 
     def get_folder_id(self,drive_service, folder_name):
         query = f"name = '{folder_name}' and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
@@ -419,7 +2736,7 @@ class OrderScraperApp(QWidget):
         self.info_label = QLabel(
             "【訂單資料】\n1. 點擊『啟動瀏覽器並登入』後，手動登入 Goshophsn。\n"
             "2. 登入完成後，返回此視窗點擊【抓取訂單】。\n"
-            "   (抓取過程中若遇到 lastorder.txt 中的 Order Code (Delivery Status 為 pending)，則停止抓取。)\n\n"
+            "   (抓取到上次同步的水位訂單所在分頁即停止；首次同步則讀取 lastorder.txt 中的 Order Code。)\n\n"
             "【產品資料】\n點擊【更新產品資料】後，程式將至產品頁面抓取資料並存成 products_list.xlsx。\n"
             "【更新產品URL】則會讀取 products_list.xlsx 資料，讓您逐筆編輯 URL。\n\n"
             "【使用者管理】\n請先建立 users.xlsx 後，下拉式選單選擇使用者，\n"
@@ -444,10 +2761,24 @@ class OrderScraperApp(QWidget):
         self.open_browser_btn.clicked.connect(self.open_browser)
         layout.addWidget(self.open_browser_btn)
 
+        self.fast_scrape_check = QCheckBox("快速抓取（登入後改以無頭模式抓取，並阻擋圖片、字型與追蹤器）")
+        layout.addWidget(self.fast_scrape_check)
+
         self.scrape_orders_btn = QPushButton("抓取訂單")
         self.scrape_orders_btn.clicked.connect(self.scrape_data)
         layout.addWidget(self.scrape_orders_btn)
 
+        sync_all_layout = QHBoxLayout()
+        self.sync_all_btn = QPushButton("同步所有帳號訂單")
+        self.sync_all_btn.clicked.connect(self.sync_all_accounts)
+        sync_all_layout.addWidget(self.sync_all_btn)
+        sync_all_layout.addWidget(QLabel("同時抓取帳號數："))
+        self.sync_concurrency_spin = QSpinBox()
+        self.sync_concurrency_spin.setRange(1, 10)
+        self.sync_concurrency_spin.setValue(3)
+        sync_all_layout.addWidget(self.sync_concurrency_spin)
+        layout.addLayout(sync_all_layout)
+
         self.update_products_btn = QPushButton("更新產品資料")
         self.update_products_btn.clicked.connect(self.update_products_data)
         layout.addWidget(self.update_products_btn)
@@ -460,9 +2791,27 @@ class OrderScraperApp(QWidget):
         self.scrape_by_order_range_btn.clicked.connect(self.scrape_by_order_range)
         layout.addWidget(self.scrape_by_order_range_btn)
 
+        self.cancel_scrape_btn = QPushButton("取消抓取")
+        self.cancel_scrape_btn.setEnabled(False)
+        self.cancel_scrape_btn.clicked.connect(self.cancel_scrape_tasks)
+        layout.addWidget(self.cancel_scrape_btn)
+
+        self.task_status_label = QLabel("", self)
+        layout.addWidget(self.task_status_label)
+
         self.select_order_btn = QPushButton("選擇訂單並出貨")
         self.select_order_btn.clicked.connect(self.select_and_ship_order)
         layout.addWidget(self.select_order_btn)
+
+        batch_cart_layout = QHBoxLayout()
+        self.batch_cart_check = QCheckBox("批次加入購物車（自動選擇規格與數量，完成後列出失敗項目）")
+        batch_cart_layout.addWidget(self.batch_cart_check)
+        batch_cart_layout.addWidget(QLabel("同時開啟分頁數："))
+        self.cart_concurrency_spin = QSpinBox()
+        self.cart_concurrency_spin.setRange(1, 6)
+        self.cart_concurrency_spin.setValue(CART_CONCURRENCY)
+        batch_cart_layout.addWidget(self.cart_concurrency_spin)
+        layout.addLayout(batch_cart_layout)
         '''
         self.process_orders_btn = QPushButton("逐筆下單")
         self.process_orders_btn.clicked.connect(self.start_order_processing)
@@ -474,9 +2823,20 @@ class OrderScraperApp(QWidget):
         layout.addWidget(self.quit_button)
 
         self.update_sales_file_btn = QPushButton("更新銷售檔案")
-        self.update_sales_file_btn.clicked.connect(self.update_sales_file)
+        self.update_sales_file_btn.clicked.connect(lambda: self.update_sales_file())
         layout.addWidget(self.update_sales_file_btn)
 
+        access_layout = QHBoxLayout()
+        self.access_status_label = QLabel("", self)
+        access_layout.addWidget(self.access_status_label)
+        self.access_progress = QProgressBar(self)
+        self.access_progress.setRange(0, 0)  # 不確定進度的忙碌指示
+        self.access_progress.setMaximumHeight(12)
+        access_layout.addWidget(self.access_progress)
+        self.access_status_label.hide()
+        self.access_progress.hide()
+        layout.addLayout(access_layout)
+
         self.sales_info_label = QLabel("銷售總合：讀取中...", self)
         self.sales_info_label.setAlignment(Qt.AlignLeft)
         layout.addWidget(self.sales_info_label)
@@ -504,23 +2864,174 @@ class OrderScraperApp(QWidget):
         self.log("🔴 正在完全關閉 Playwright...")
 
         try:
-            # 關閉瀏覽器
-            if self.browser:
-                self.browser.close()
-                self.browser = None
-                self.log("✅ 瀏覽器已關閉")
-
-            # 停止 Playwright
-            if self.playwright:
-                self.playwright.stop()
-                self.playwright = None
-                self.log("✅ Playwright 進程已完全停止")
+            self.page = None
+            self.engine.shutdown()
+            self.scrape_worker.close_browsers()
+            self.log("✅ 瀏覽器已關閉，Playwright 進程已完全停止")
 
         except Exception as e:
             self.log(f"❌ 退出 Playwright 時發生錯誤：{traceback.format_exc()}")
 
         QMessageBox.information(self, "Playwright 已關閉", "Playwright 已完全關閉，您可以重新啟動它。")
 
+    def closeEvent(self, event):
+        """關閉主視窗時一併關閉共用的瀏覽器引擎，並等待進行中的 Google 同步寫完"""
+        try:
+            self.engine.shutdown()
+            self.scrape_worker.shutdown()
+            self.log("等待 Google 同步工作完成...")
+            google_credentials.shutdown()
+        except Exception:
+            self.log(f"關閉瀏覽器引擎時發生錯誤：{traceback.format_exc()}")
+        super().closeEvent(event)
+
+
+    def release_page(self):
+        """將目前的頁面歸還給 BrowserEngine"""
+        if self.page:
+            self.engine.release_page(self.page)
+        self.page = None
+
+    def seller_state_file(self):
+        return os.path.join(self.current_user_dir, SELLER_STATE_FILE) if self.current_user_dir else None
+
+    def buyer_state_file(self):
+        return os.path.join(self.current_user_dir, BUYER_STATE_FILE) if self.current_user_dir else None
+
+    def prepare_seller_session(self):
+        """
+        將主視窗瀏覽器目前的賣家登入狀態寫入狀態檔，交給背景抓取核心沿用。
+        回傳狀態檔路徑；從未登入過則回傳 None。
+        """
+        state_file = self.seller_state_file()
+        if (self.page and not self.page.is_closed() and self.page.url.startswith("https://goshophsn.com")
+                and is_seller_session_valid(self.page)):
+            self.page.context.storage_state(path=state_file)
+        return load_storage_state(state_file)
+
+    def handle_session_expired(self):
+        """背景抓取回報登入失效：刪除狀態檔並回到手動登入流程"""
+        self.log("儲存的登入狀態已失效，請重新手動登入。")
+        discard_storage_state(self.seller_state_file())
+        self.release_page()
+        self.engine.close_context(self.user_combo.currentText(), SITE_SELLER)
+        self.open_browser()
+        QMessageBox.information(self, "提示", "登入狀態已失效，請在瀏覽器中重新登入後再執行一次。")
+
+    # -------------------------------
+    # 背景抓取工作
+    # -------------------------------
+    def start_scrape_task(self, name, coro_func, *args, user=None, state_file=None):
+        """將抓取工作交給 ScrapeWorker；勾選快速抓取時以無頭模式執行並阻擋非必要資源"""
+        user = user or self.user_combo.currentText()
+        state_file = state_file or os.path.join(self.base_dir, user, SELLER_STATE_FILE)
+        fast_scrape = self.fast_scrape_check.isChecked()
+        task_id = self.scrape_worker.submit(name, coro_func, user, state_file, *args,
+                                            fast_scrape, fast_scrape)
+        self.running_tasks[task_id] = name
+        self.update_task_buttons()
+        return task_id
+
+    def update_task_buttons(self):
+        running = set(self.running_tasks.values())
+        self.scrape_orders_btn.setEnabled("orders" not in running)
+        self.sync_all_btn.setEnabled("orders" not in running)
+        self.scrape_by_order_range_btn.setEnabled("order_range" not in running)
+        self.update_products_btn.setEnabled("products" not in running)
+        self.select_order_btn.setEnabled("cart" not in running)
+        # 抓取中的結果要寫回該使用者目錄，期間不允許切換使用者
+        self.user_combo.setEnabled(not running)
+        self.cancel_scrape_btn.setEnabled(bool(running))
+        if not running:
+            self.task_status_label.setText("")
+
+    def cancel_scrape_tasks(self):
+        self.log("已要求取消抓取工作。")
+        for task_id in list(self.running_tasks):
+            self.scrape_worker.cancel(task_id)
+
+    def on_page_scraped(self, task_id, page_no, row_count):
+        self.task_status_label.setText(f"抓取進度：第 {page_no} 頁，累計 {row_count} 筆")
+
+    def on_task_finished(self, task_id, name, result):
+        self.running_tasks.pop(task_id, None)
+        self.update_task_buttons()
+        self.log(f"導航耗時統計：{latency_profile.summary()}")
+        handlers = {
+            "orders": self.export_scraped_orders,
+            "order_range": self.export_order_range,
+            "products": self.save_scraped_products,
+            "cart": self.show_cart_summary,
+        }
+        handlers[name](result)
+        if task_id in self.sync_all_results:
+            self.finish_sync_all_task(task_id, f"{result['user']}：{len(result['pending_orders'])} 筆 Pending 訂單")
+
+    def on_task_failed(self, task_id, name, error, error_traceback):
+        self.running_tasks.pop(task_id, None)
+        self.update_task_buttons()
+        if task_id in self.sync_all_results:
+            if isinstance(error, SessionExpiredError):
+                discard_storage_state(os.path.join(self.base_dir, error.args[0], SELLER_STATE_FILE))
+                summary = f"{error.args[0]}：登入狀態已失效，請切換到此使用者重新登入"
+            else:
+                summary = f"抓取失敗：{error}"
+            self.log(f"抓取資料時出錯：{error_traceback}")
+            self.finish_sync_all_task(task_id, summary)
+            return
+        if isinstance(error, SessionExpiredError):
+            self.handle_session_expired()
+            return
+        self.log(f"抓取資料時出錯：{error_traceback}")
+        QMessageBox.critical(self, "錯誤", f"抓取資料時出錯：{error}")
+
+    def on_task_cancelled(self, task_id, name):
+        self.running_tasks.pop(task_id, None)
+        self.update_task_buttons()
+        self.log("抓取工作已取消。")
+        if task_id in self.sync_all_results:
+            self.finish_sync_all_task(task_id, "已取消")
+
+    # -------------------------------
+    # 全部帳號同步
+    # -------------------------------
+    def sync_all_accounts(self):
+        """同時抓取 users.xlsx 中所有帳號的訂單，各帳號使用獨立 context 與自己的同步水位"""
+        df_users = getattr(self, "df_users", None)
+        if df_users is None or df_users.empty:
+            self.log("尚未建立 users.xlsx，請先新增使用者。")
+            return
+        slots = asyncio.Semaphore(self.sync_concurrency_spin.value())
+        self.prepare_seller_session()  # 目前使用者若剛登入，先寫入狀態檔
+        skipped = []
+        for user in df_users["user"]:
+            user_dir = os.path.join(self.base_dir, user)
+            if not load_storage_state(os.path.join(user_dir, SELLER_STATE_FILE)):
+                skipped.append(f"{user}：尚未登入過，請先切換到此使用者啟動瀏覽器並登入")
+                continue
+            if not os.path.exists(os.path.join(user_dir, "products_list.xlsx")):
+                skipped.append(f"{user}：請先建立產品目錄 (products_list.xlsx)")
+                continue
+            task_id = self.start_scrape_task("orders", sync_account_orders_async, self.read_watermark(user, user_dir),
+                                             functools.partial(self.replicate_watermark, user, user_dir), slots,
+                                             user=user)
+            self.sync_all_results[task_id] = None
+        for message in skipped:
+            self.log(message)
+        if not self.sync_all_results:
+            QMessageBox.information(self, "提示", "沒有可同步的帳號。\n" + "\n".join(skipped))
+            return
+        self.sync_all_skipped = skipped
+        self.log(f"開始同步 {len(self.sync_all_results)} 個帳號，同時抓取 {self.sync_concurrency_spin.value()} 個。")
+
+    def finish_sync_all_task(self, task_id, summary):
+        self.sync_all_results[task_id] = summary
+        if any(result is None for result in self.sync_all_results.values()):
+            return
+        lines = list(self.sync_all_results.values()) + self.sync_all_skipped
+        self.sync_all_results = {}
+        self.read_sales_data()
+        QMessageBox.information(self, "同步完成", "所有帳號訂單同步完成：\n" + "\n".join(lines))
 
     def disable_buttons(self):
         self.scrape_orders_btn.setEnabled(False)
@@ -528,7 +3039,6 @@ class OrderScraperApp(QWidget):
         self.update_product_url_btn.setEnabled(False)
         self.scrape_by_order_range_btn.setEnabled(False)
         self.select_order_btn.setEnabled(False)
-        self.process_orders_btn.setEnabled(False)
 
     def load_users(self):
         if os.path.exists(self.users_file):
@@ -546,6 +3056,7 @@ class OrderScraperApp(QWidget):
 
     def change_base_dir(self):
         user = self.user_combo.currentText()
+        self.release_page()  # 頁面屬於前一位使用者的 context
         if user:
             self.current_user_dir = os.path.join(self.base_dir, user)
             if not os.path.exists(self.current_user_dir):
@@ -609,12 +3120,10 @@ class OrderScraperApp(QWidget):
         length_of_order_code_list = len(order_code_list)
         user = self.user_combo.currentText()
 
-        # Read the '進貨價' column from products_list.xlsx
-        products_file = os.path.join(self.current_user_dir, "products_list.xlsx")
-        df_products = pd.read_excel(products_file)
-
-        # Create a dictionary to map product names to their prices
-        product_price_map = dict(zip(df_products["Name"], df_products["進貨價"]))
+        # Map product names to their '進貨價' from the cached products_list.xlsx
+        catalog = product_catalogs.catalog(self.current_user_dir)
+        catalog.refresh()
+        product_price_map = catalog.price_map
 
         # Multiply the '進貨價' with the corresponding products in df_orders and sum the results
         df_orders["進貨價"] = df_orders["Product Name"].apply(lambda name: product_price_map.get(name, 0))
@@ -640,7 +3149,68 @@ class OrderScraperApp(QWidget):
             clipboard.setText(message)
 
             # 開始出貨流程
-            self.start_shipping_process(df_orders, message)
+            if self.batch_cart_check.isChecked():
+                self.start_cart_batch(df_orders, message)
+            else:
+                self.start_shipping_process(df_orders, message)
+
+    # -------------------------------
+    # 批次加入購物車
+    # -------------------------------
+    def start_cart_batch(self, df_orders, message):
+        """在背景以多個分頁自動將所有合併後品項加入購物車"""
+        if not load_storage_state(self.buyer_state_file()):
+            QMessageBox.information(self, "提示", "尚未儲存百寶倉登入狀態，請先取消勾選批次加入購物車，以逐筆出貨登入一次。")
+            return
+        lines = [
+            {"Product Name": row["Product Name"], "Attribute": row["Attribute"],
+             "Quantity": int(row["Quantity"]), "Product URL": row["Product URL"]}
+            for row in df_orders[CART_LINE_COLUMNS].to_dict("records")
+        ]
+        self.cart_batch_message = message
+        self.log(f"開始批次加入購物車，共 {len(lines)} 項...")
+        self.start_scrape_task("cart", add_to_cart_batch_async, lines, self.cart_concurrency_spin.value(),
+                               state_file=self.buyer_state_file())
+
+    def show_cart_summary(self, result):
+        """批次完成後彙整一次結果；失敗項目可改以逐筆出貨處理"""
+        added = result["added"]
+        failures = result["failures"]
+        summary = f"{result['user']}\n已加入購物車 {len(added)} 項，失敗 {len(failures)} 項。"
+        self.log(summary)
+        details = "\n".join(
+            f"{i + 1}. {item['Product Name']} - {item['Attribute']} x {item['Quantity']}：{item['原因']}"
+            for i, item in enumerate(failures)
+        )
+        if details:
+            self.log(f"需手動處理的項目：\n{details}")
+
+        msg_box = QMessageBox(self)
+        msg_box.setWindowTitle("批次加入購物車完成")
+        msg_box.setText(summary)
+        if details:
+            msg_box.setDetailedText(details)
+            manual_button = msg_box.addButton("逐筆處理失敗項目", QMessageBox.AcceptRole)
+        else:
+            manual_button = None
+        cart_button = msg_box.addButton("開啟購物車", QMessageBox.ActionRole)
+        msg_box.addButton("關閉", QMessageBox.RejectRole)
+        msg_box.exec_()
+
+        if manual_button is not None and msg_box.clickedButton() == manual_button:
+            df_failures = pd.DataFrame(failures, columns=CART_LINE_COLUMNS)
+            self.start_shipping_process(df_failures, self.cart_batch_message)
+        elif msg_box.clickedButton() == cart_button:
+            self.open_buyer_cart(result["user"])
+
+    def open_buyer_cart(self, user):
+        try:
+            self.release_page()
+            storage_state = load_storage_state(self.buyer_state_file())
+            self.page = self.engine.acquire_page(user, SITE_BUYER, storage_state=storage_state)
+            self.page.goto(BUYER_CART_URL, wait_until="domcontentloaded")
+        except Exception as e:
+            self.log(f"開啟購物車時出錯：{traceback.format_exc()}")
 
     def start_shipping_process(self, df_orders, message):
         dialog = DialogWindow()
@@ -648,31 +3218,53 @@ class OrderScraperApp(QWidget):
         # QMessageBox.information(self, "開始出貨", f"{user}\n即將進入逐筆出貨流程，請稍候...")
         try:
             self.log("正在啟動瀏覽器並導航到登錄頁面...")
-            self.playwright = sync_playwright().start()
-            self.browser = self.playwright.chromium.launch(channel="msedge", headless=False)
-            context = self.browser.new_context()
-            self.page = context.new_page()
-
-            self.page.goto("https://baibaoshop.com/")
-            self.page.click("body > div.wd-page-wrapper.website-wrapper > header > div > div.whb-row.whb-general-header.whb-not-sticky-row.whb-with-bg.whb-border-fullwidth.whb-color-light.whb-flex-equal-sides > div > div > div.whb-column.whb-col-right.whb-visible-lg > div.wd-header-my-account.wd-tools-element.wd-event-hover.wd-design-1.wd-account-style-icon.whb-vssfpylqqax9pvkfnxoz > a > span.wd-tools-icon")
-            self.page.fill('input[name="username"]', user)
-            self.page.mouse.move(random.randint(0, 1000), random.randint(0, 1000))
-            time.sleep(random.uniform(1, 3))
-            self.page.click(
-                "body > div.wd-page-wrapper.website-wrapper > header > div > div.whb-row.whb-general-header.whb-not-sticky-row.whb-with-bg.whb-border-fullwidth.whb-color-light.whb-flex-equal-sides > div > div > div.whb-column.whb-col-left.whb-visible-lg > div.site-logo > a > img")
-            time.sleep(random.uniform(1, 3))
-            self.log("請在新開啟的瀏覽器中手動登入。")
-            print("等待使用者點擊 PyQt 對話框...")
-
-            # 顯示 PyQt5 對話框
-            dialog.show_dialog(user)
-
-            print("使用者已確認，繼續執行 Playwright")
+            self.release_page()
+            storage_state = load_storage_state(self.buyer_state_file())
+            self.page = self.engine.acquire_page(user, SITE_BUYER, storage_state=storage_state)
+            context = self.page.context
+
+            buyer_logged_in = False
+            if storage_state:
+                navigate_sync(self.page, "buyer_account",
+                              lambda: self.page.goto(BUYER_ACCOUNT_URL, wait_until="domcontentloaded"), user)
+                buyer_logged_in = is_buyer_session_valid(self.page)
+                if buyer_logged_in:
+                    self.log("已沿用儲存的百寶倉登入狀態，無需重新登入。")
+                else:
+                    self.log("儲存的百寶倉登入狀態已失效，改為手動登入。")
+                    discard_storage_state(self.buyer_state_file())
+
+            if not buyer_logged_in:
+                self.page.goto("https://baibaoshop.com/")
+                self.page.click("body > div.wd-page-wrapper.website-wrapper > header > div > div.whb-row.whb-general-header.whb-not-sticky-row.whb-with-bg.whb-border-fullwidth.whb-color-light.whb-flex-equal-sides > div > div > div.whb-column.whb-col-right.whb-visible-lg > div.wd-header-my-account.wd-tools-element.wd-event-hover.wd-design-1.wd-account-style-icon.whb-vssfpylqqax9pvkfnxoz > a > span.wd-tools-icon")
+                self.page.fill('input[name="username"]', user)
+                self.page.mouse.move(random.randint(0, 1000), random.randint(0, 1000))
+                time.sleep(random.uniform(1, 3))
+                self.page.click(
+                    "body > div.wd-page-wrapper.website-wrapper > header > div > div.whb-row.whb-general-header.whb-not-sticky-row.whb-with-bg.whb-border-fullwidth.whb-color-light.whb-flex-equal-sides > div > div > div.whb-column.whb-col-left.whb-visible-lg > div.site-logo > a > img")
+                time.sleep(random.uniform(1, 3))
+                self.log("請在新開啟的瀏覽器中手動登入。")
+                print("等待使用者點擊 PyQt 對話框...")
+
+                # 顯示 PyQt5 對話框
+                dialog.show_dialog(user)
+
+                print("使用者已確認，繼續執行 Playwright")
+
+                # 登入成功才保存狀態，下次出貨即可略過手動登入
+                navigate_sync(self.page, "buyer_account",
+                              lambda: self.page.goto(BUYER_ACCOUNT_URL, wait_until="domcontentloaded"), user)
+                if is_buyer_session_valid(self.page):
+                    context.storage_state(path=self.buyer_state_file())
+                    self.log("已儲存百寶倉登入狀態。")
         except Exception as e:
             self.log(f"啟動瀏覽器時出錯：{e}")
             return
         sub_total = 0
-        for idx, row in df_orders.iterrows():
+        # 第二個分頁用來預先載入下一筆商品
+        prefetcher = ProductPagePrefetcher(self.page, self.engine.acquire_page(user, SITE_BUYER), user)
+        next_urls = df_orders["Product URL"].tolist()[1:] + [None]
+        for (idx, row), next_url in zip(df_orders.iterrows(), next_urls):
             product_name = row["Product Name"]
             attribute = row["Attribute"]
             quantity = row["Quantity"]
@@ -681,9 +3273,13 @@ class OrderScraperApp(QWidget):
             total_quantity = df_orders["Quantity"].sum()
             try:
                 self.log(f"正在打開訂單 URL: {link_url}")
-                self.page.wait_for_load_state("networkidle")  # 等待網頁完全載入
-                self.page.goto(link_url)
-                time.sleep(random.uniform(1, 3))
+                try:
+                    if not prefetcher.show(link_url):
+                        time.sleep(random.uniform(1, 3))
+                except PlaywrightTimeoutError:
+                    self.log(f"商品頁面未在時限內就緒，請確認頁面內容：{link_url}")
+                self.page = prefetcher.page
+                prefetcher.prefetch(next_url)
                 self.log(f"正在出貨: {idx + 1}. {product_name} - {attribute} - 數量: {quantity}")
                 msg_box = QMessageBox(self)
                 msg_box.setWindowTitle("出貨中")
@@ -721,12 +3317,8 @@ class OrderScraperApp(QWidget):
         else:
             print("對話框關閉")
 
-        if self.browser:
-            self.browser.close()
-            self.browser = None
-        if self.playwright:
-            self.playwright.stop()
-            self.playwright = None
+        self.engine.release_page(prefetcher.spare_page)
+        self.release_page()
 
     def select_and_ship_order(self):
         if not self.current_user_dir:
@@ -770,17 +3362,24 @@ class OrderScraperApp(QWidget):
 
     def open_browser(self):
         self.log("正在啟動瀏覽器...")
-        if self.browser:
+        if self.page and not self.page.is_closed():
             self.log("瀏覽器已經啟動。")
             return
         try:
             user = self.user_combo.currentText()
             # QMessageBox.information(self, "提示", f"正在為使用者 {user} 啟動瀏覽器，請稍候...", QMessageBox.Ok)
-            self.playwright = sync_playwright().start()
-            self.browser = self.playwright.chromium.launch(channel="msedge", headless=False)
-            context = self.browser.new_context()
-            self.page = context.new_page()
-            self.page.goto("https://goshophsn.com/users/login")
+            logged_in_before = self.engine.has_context(user, SITE_SELLER)
+            storage_state = load_storage_state(self.seller_state_file())
+            self.page = self.engine.acquire_page(user, SITE_SELLER, storage_state=storage_state)
+            if logged_in_before or storage_state:
+                navigate_sync(self.page, "seller_table",
+                              lambda: self.page.goto(SELLER_ORDERS_URL, wait_until="domcontentloaded"), user)
+                if is_seller_session_valid(self.page):
+                    self.log("已沿用儲存的登入狀態，無需重新登入。")
+                    return
+                self.log("儲存的登入狀態已失效，改為手動登入。")
+                discard_storage_state(self.seller_state_file())
+            self.page.goto(SELLER_LOGIN_URL)
             self.page.fill('input[type="email"]', user)
             #QMessageBox.information(self, "提示", f"請以 {user} 帳號登入", QMessageBox.Ok)
 
@@ -802,13 +3401,33 @@ class OrderScraperApp(QWidget):
             QMessageBox.information(self, "提示", "請先建立產品目錄 (products_list.xlsx)", QMessageBox.Ok)
             return
 
-        if not self.page:
+        if not self.prepare_seller_session():
             self.log("請先啟動瀏覽器並手動登入。")
             QMessageBox.information(self, "提示", "請先啟動瀏覽器並手動登入。")
             return
 
+        user = self.user_combo.currentText()
+        self.start_scrape_task("orders", scrape_orders_async, self.read_watermark(user, self.current_user_dir),
+                               functools.partial(self.replicate_watermark, user, self.current_user_dir))
+
+    def read_watermark(self, user, user_dir):
+        """
+        由訂單資料庫取得同步水位（只讀本機，不連線）；資料庫中還沒有此帳號的水位時，以 lastorder.txt 寫入水位。
+        其他電腦寫到雲端的水位由抓取核心開始抓取前在 Google 執行緒中讀取併入。
+        """
+        watermark_codes = self.order_store.load_watermark(user)
+        if watermark_codes:
+            self.log(f"[{user}] 讀取到同步水位 {len(watermark_codes)} 筆，最新為 {watermark_codes[0]}")
+            return watermark_codes
+        stop_order_code = self.read_stop_order_code(user_dir)
+        if not stop_order_code:
+            return []
+        self.order_store.save_watermark(user, [stop_order_code])
+        return [stop_order_code]
+
+    def read_stop_order_code(self, user_dir):
         stop_order_code = None
-        lastorder_file = os.path.join(self.current_user_dir, "lastorder.txt")
+        lastorder_file = os.path.join(user_dir, "lastorder.txt")
         if os.path.exists(lastorder_file):
             try:
                 with open(lastorder_file, "r", encoding="utf-8") as f:
@@ -817,69 +3436,31 @@ class OrderScraperApp(QWidget):
             except Exception as e:
                 self.log(f"讀取 lastorder.txt 出錯：{e}")
         else:
-            stop_order_code = None
             self.log("未找到 lastorder.txt，將分別存 Pending 與非 Pending 的訂單。")
-
+        return stop_order_code
+
+    def export_scraped_orders(self, result):
+        """背景抓取完成後，將訂單存成 Excel 並更新同步水位、lastorder.txt 與銷售檔案"""
+        pending_orders = result["pending_orders"]
+        rest_orders = result["rest_orders"]
+        user = result["user"]
+        user_dir = os.path.join(self.base_dir, user)
+        notify = not result.get("batch")
+        lastorder_file = os.path.join(user_dir, "lastorder.txt")
+        if result.get("cloud_watermark"):
+            self.order_store.save_watermark(user, result["cloud_watermark"])  # 其他電腦看過的訂單
         try:
-            self.log("正在導航到訂單頁面...")
-            self.page.goto("https://goshophsn.com/seller/orders")
-            self.page.wait_for_load_state('networkidle')
-
-            pending_orders = []
-            rest_orders = []
-            stop_grabbing = False
-
-            while not stop_grabbing:
-                self.page.wait_for_selector("table tbody tr", timeout=10000)
-                self.log("正在抓取當前分頁訂單資料...")
-                table_rows = self.page.locator("table tbody tr")
-                for i in range(table_rows.count()):
-                    row_data = table_rows.nth(i).locator("td").all_inner_texts()
-                    cleaned_row_data = [cell.strip() for cell in row_data]
-                    order_code = cleaned_row_data[1] if len(cleaned_row_data) > 1 else ""
-                    status = cleaned_row_data[7].lower() if len(cleaned_row_data) > 7 else ""
-                    if stop_order_code and order_code == stop_order_code:
-                        self.log(f"遇到訂單編號 {order_code}，停止抓取。")
-                        stop_grabbing = True
-                        break
-                    for idx in [4, 5, 6]:
-                        if len(cleaned_row_data) > idx:
-                            try:
-                                cleaned_row_data[idx] = float(cleaned_row_data[idx].replace("$", "").replace(",", ""))
-                            except Exception:
-                                cleaned_row_data[idx] = 0.0
-                    try:
-                        if len(cleaned_row_data) > 2:
-                            cleaned_row_data[2] = int(cleaned_row_data[2])
-                    except Exception:
-                        cleaned_row_data[2] = 0
-                    if status == "pending":
-                        pending_orders.append(cleaned_row_data)
-                    else:
-                        rest_orders.append(cleaned_row_data)
-                if not stop_grabbing:
-                    next_button = self.page.locator("a[aria-label='Next »']")
-                    if next_button.is_visible():
-                        self.log("正在翻到下一頁...")
-                        next_button.click()
-                        self.page.wait_for_load_state('networkidle')
-                    else:
-                        self.log("所有分頁抓取完畢。")
-                        break
-                else:
-                    self.log("抓取已因遇到 lastorder.txt 指定的 Order Code 而停止。")
-                    break
-
-            columns = ["#", "Order Code", "Num. of Products", "Customer", "Amount", "Service charge",
-                       "Final price", "Delivery Status", "Payment Status", "Product Info", "Options"]
-
             if os.path.exists(lastorder_file):
-                df_pending = pd.DataFrame(pending_orders, columns=columns)
+                df_pending = pd.DataFrame(pending_orders, columns=ORDER_COLUMNS)
                 # 呼叫 split_and_merge_orders
                 print("split_and_merge_orders", df_pending)
-                user = self.user_combo.currentText()
-                split_df, merged_df = self.split_and_merge_orders(df_pending)
-                file_path = os.path.join(self.current_user_dir,
+                df_rest = pd.DataFrame(rest_orders, columns=ORDER_COLUMNS)
+                split_df, merged_df = self.split_and_merge_orders(df_pending, user_dir)
+                rest_split_df, _ = split_product_info(df_rest)
+                self.store_orders(user, pd.concat([df_pending, df_rest], ignore_index=True),
+                                  pd.concat([split_df, rest_split_df], ignore_index=True))
+                self.record_watermark(user, pending_orders + rest_orders)
+                file_path = os.path.join(user_dir,
                                          f"goshop_orders_{datetime.now().strftime('%Y%m%d')}_{user}.xlsx")
                 with pd.ExcelWriter(file_path) as writer:
                     df_pending.to_excel(writer, sheet_name="原始資料", index=False)
@@ -893,15 +3474,18 @@ class OrderScraperApp(QWidget):
                         f.write(first_order_code)
                     self.log(f"已建立 {lastorder_file}，內容為第一筆訂單的 Order Code：{first_order_code}")
                     # msg_text += f"已建立 {lastorder_file}，內容為第一筆訂單的 Order Code：{first_order_code}"
-                    self.update_sales_file()
+                    self.update_sales_file(user_dir, notify)
             else:
-                df_pending = pd.DataFrame(pending_orders, columns=columns)
-                df_rest = pd.DataFrame(rest_orders, columns=columns)
-                split_df, merged_df = self.split_and_merge_orders(df_pending)
-                user = self.user_combo.currentText()
-                file_path_pending = os.path.join(self.current_user_dir,
+                df_pending = pd.DataFrame(pending_orders, columns=ORDER_COLUMNS)
+                df_rest = pd.DataFrame(rest_orders, columns=ORDER_COLUMNS)
+                split_df, merged_df = self.split_and_merge_orders(df_pending, user_dir)
+                rest_split_df, _ = split_product_info(df_rest)
+                self.store_orders(user, pd.concat([df_pending, df_rest], ignore_index=True),
+                                  pd.concat([split_df, rest_split_df], ignore_index=True))
+                self.record_watermark(user, pending_orders + rest_orders)
+                file_path_pending = os.path.join(user_dir,
                                                  f"goshop_orders_{datetime.now().strftime('%Y%m%d')}_{user}.xlsx")
-                file_path_rest = os.path.join(self.current_user_dir, "goshop_orders_rest_{user}.xlsx")
+                file_path_rest = os.path.join(user_dir, "goshop_orders_rest_{user}.xlsx")
                 with pd.ExcelWriter(file_path_pending) as writer:
                     df_pending.to_excel(writer, sheet_name="原始資料", index=False)
                     split_df.to_excel(writer, sheet_name="拆分後資料", index=False)
@@ -915,28 +3499,56 @@ class OrderScraperApp(QWidget):
                         f.write(first_order_code)
                     # msg_text += f"已建立 {lastorder_file}，內容為第一筆訂單的 Order Code：{first_order_code}"
                     self.log(f"已建立 {lastorder_file}，內容為第一筆訂單的 Order Code：{first_order_code}")
-                    total_amount_pending, total_service_charge_pending, total_final_price_pending, total_amount_rest, total_service_charge_rest, total_final_price_rest=self.update_sales_file_split(df_pending, df_rest)
+                    total_amount_pending, total_service_charge_pending, total_final_price_pending, total_amount_rest, total_service_charge_rest, total_final_price_rest=self.update_sales_file_split(df_pending, df_rest, user_dir)
         except Exception as e:
-            self.log(f"抓取資料時出錯：{traceback.format_exc()}")
-            QMessageBox.critical(self, "錯誤", f"抓取資料時出錯：{traceback.format_exc()}")
+            self.log(f"儲存訂單資料時出錯：{traceback.format_exc()}")
+            QMessageBox.critical(self, "錯誤", f"儲存訂單資料時出錯：{traceback.format_exc()}")
 
-        finally:
-            # 顯示銷售總合的訊息框
-            '''
-            msg_box = QMessageBox(self)
-            msg_box.setWindowTitle("銷售總合")
-            msg_text += f"\n銷售總合：{total_amount_pending:.2f} (Pending) 與 {total_amount_rest:.2f} (Rest)"
-            msg_box.setText(msg_text)
-            msg_box.setStandardButtons(QMessageBox.Ok)
-            msg_box.setStyleSheet("QLabel{min-width: 800px; max-width: 800px; text-align: left;}")
-            msg_box.exec_()
-            '''
-            if self.browser:
-                self.browser.close()
-                self.browser = None
-            if self.playwright:
-                self.playwright.stop()
-                self.playwright = None
+    def store_orders(self, user, df_orders, split_df):
+        """先寫入訂單資料庫（同一交易），Excel 之後才作為匯出"""
+        count = self.order_store.save_orders(user, df_orders, split_df)
+        self.log(f"[{user}] 已寫入訂單資料庫 {count} 筆訂單、{len(split_df)} 筆品項")
+        try:
+            write_order_snapshot(os.path.join(self.base_dir, ORDER_SNAPSHOT_DIR), user, df_orders)
+        except Exception:
+            # 快照僅供分析，寫入失敗不影響訂單資料庫與 Excel 匯出
+            self.log(f"[{user}] 寫入 Parquet 快照時出錯：{traceback.format_exc()}")
+
+    def record_watermark(self, user, orders):
+        """以本次抓到的訂單更新水位（寫入訂單資料庫），下次同步抓到這裡即停止"""
+        order_codes = [row[1] for row in orders if len(row) > 1]
+        if not order_codes:
+            return
+        self.order_store.save_watermark(user, order_codes)
+        self.log(f"[{user}] 同步水位已更新，最新為 {max(order_codes)}")
+        self.start_watermark_replication([(user, os.path.join(self.base_dir, user))],
+                                         self.order_store.load_watermark(user))
+
+    def start_watermark_replication(self, accounts, codes=None):
+        """codes 為 None 時只更新雲端水位的本機快取，否則把 codes 推送到雲端"""
+        for user, user_dir in accounts:
+            self.google_tasks.submit(functools.partial(self.replicate_watermark, user, user_dir, codes),
+                                     functools.partial(self.on_watermark_replicated, user),
+                                     functools.partial(self.on_watermark_failed, user))
+
+    def replicate_watermark(self, user, user_dir, codes=None):
+        """在 Google 執行緒中讀取或推送雲端水位，回傳雲端上的水位；只讀取時快取未過期即不連線"""
+        replica = ReplicatedWatermark(user_dir)
+        if codes is None and replica.is_fresh():
+            return replica.codes
+        folder_id = self.user_folder_id(user)
+        if codes is None:
+            return replica.pull(self.get_drive_service(), folder_id)
+        return replica.push(self.get_drive_service(), folder_id, codes)
+
+    def on_watermark_replicated(self, user, codes):
+        if codes:
+            # 其他電腦看過的訂單也記入本機水位，下次同步不會重抓
+            self.order_store.save_watermark(user, codes)
+            self.log(f"[{user}] 雲端水位已同步，最新為 {codes[0]}")
+
+    def on_watermark_failed(self, user, error):
+        self.log(f"[{user}] 同步雲端水位時出錯：{error}")
 
     def scrape_by_order_range(self):
         if not self.current_user_dir:
@@ -952,64 +3564,34 @@ class OrderScraperApp(QWidget):
                 QMessageBox.information(self, "提示", "請輸入開始和結束訂單號碼。", QMessageBox.Ok)
 
     def scrape_data_by_order_range(self, start_order, end_order):
-        if not self.page:
+        if not self.prepare_seller_session():
             self.log("請先啟動瀏覽器並手動登入。")
             return
 
-        try:
-            self.log("正在導航到訂單頁面...")
-            self.page.goto("https://goshophsn.com/seller/orders")
-            self.page.wait_for_load_state('networkidle')
-
-            all_data = []
-            start_scraping = False
-            found_end_order = False
-
-            while True:
-                self.page.wait_for_selector("table tbody tr", timeout=10000)
-                self.log("正在抓取當前分頁訂單資料...")
-                table_rows = self.page.locator("table tbody tr")
-                row_count = table_rows.count()
-
-                for i in range(row_count):
-                    row_data = table_rows.nth(i).locator("td").all_inner_texts()
-                    cleaned_row_data = [cell.strip() for cell in row_data]
-                    order_code = cleaned_row_data[1] if len(cleaned_row_data) > 1 else ""
-                    self.log(f"當前處理訂單編號: {order_code}")
-                    if order_code == start_order:
-                        start_scraping = True
-                        self.log("找到起始訂單，開始記錄資料...")
-                    if order_code == end_order:
-                        self.log("已找到結束訂單，停止記錄並退出...")
-                        if start_scraping:
-                            all_data.append(cleaned_row_data)
-                        found_end_order = True
-                        break
-                    if start_scraping:
-                        all_data.append(cleaned_row_data)
-                if found_end_order:
-                    break
-                next_button = self.page.locator("a[aria-label='Next »']")
-                if next_button.is_visible():
-                    self.log("正在翻到下一頁...")
-                    next_button.click()
-                    self.page.wait_for_load_state('networkidle')
-                else:
-                    self.log("已遍歷所有分頁，但未找到結束訂單。")
-                    break
+        self.start_scrape_task("order_range", scrape_order_range_async, start_order, end_order)
 
+    def export_order_range(self, result):
+        """背景抓取完成後，將指定範圍的訂單存成 Excel"""
+        all_data = result["orders"]
+        start_order = result["start_order"]
+        end_order = result["end_order"]
+        try:
             if not all_data:
                 self.log("未抓取到任何訂單資料。")
                 return
 
-            df_original = pd.DataFrame(all_data, columns=[
-                "#", "Order Code", "Num. of Products", "Customer", "Amount", "Service charge",
-                "Final price", "Delivery Status", "Payment Status", "Product Info", "Options"
-            ])
+            df_original = pd.DataFrame(all_data, columns=ORDER_COLUMNS)
 
-            split_df, merged_df = self.split_and_merge_orders(df_original)
-            user = self.user_combo.currentText()
-            file_path = os.path.join(self.current_user_dir, f"goshop_orders_{start_order}_to_{end_order}_{user}.xlsx")
+            # 抓取期間可能已切換使用者，一律以抓取結果的帳號為準
+            user = result["user"]
+            user_dir = os.path.join(self.base_dir, user)
+            split_df, merged_df = self.split_and_merge_orders(df_original, user_dir)
+            try:
+                self.store_orders(user, df_original, split_df)
+            except Exception:
+                # 範圍匯出以 Excel 為主，資料庫寫入失敗時仍照常存檔
+                self.log(f"[{user}] 寫入訂單資料庫時出錯：{traceback.format_exc()}")
+            file_path = os.path.join(user_dir, f"goshop_orders_{start_order}_to_{end_order}_{user}.xlsx")
             with pd.ExcelWriter(file_path) as writer:
                 df_original.to_excel(writer, sheet_name="原始資料", index=False)
                 split_df.to_excel(writer, sheet_name="拆分後資料", index=False)
@@ -1017,7 +3599,7 @@ class OrderScraperApp(QWidget):
 
             self.log(f"訂單資料已存成 Excel 檔案：{file_path}")
         except Exception as e:
-            self.log(f"抓取訂單資料時發生錯誤: {traceback.format_exc()}")
+            self.log(f"儲存訂單資料時發生錯誤: {traceback.format_exc()}")
 
     '''
     def update_sales_file(self, df):
@@ -1052,31 +3634,28 @@ class OrderScraperApp(QWidget):
             self.log(f"更新銷售檔案時出錯：{traceback.format_exc()}")
     '''
 
-    def update_sales_file(self):
+    def update_sales_file(self, user_dir=None, notify=True):
+        user_dir = user_dir or self.current_user_dir
         try:
-            today = datetime.now().strftime("%Y-%m-%d")
-            total_revenue = 0
-            sales_data = []
-
-            for file_name in os.listdir(self.current_user_dir):
-                if file_name.startswith("goshop_orders") and file_name.endswith(".xlsx"):
-                    file_path = os.path.join(self.current_user_dir, file_name)
-                    df = pd.read_excel(file_path, sheet_name="原始資料")
-                    revenue = df["Final price"].sum()
-                    total_revenue += revenue
-                    sales_data.append({"檔案名": file_name, "revenue": revenue})
-            total_revenue = round(total_revenue, 2)
-            sales_df = pd.DataFrame(sales_data)
-            sales_file = os.path.join(self.current_user_dir, "sales.xlsx")
-            # sales_df.to_excel(sales_file,sheet_name="銷售記錄", index=False)
-            with pd.ExcelWriter(sales_file, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
+            ledger = SalesLedger(user_dir)
+            reread = ledger.refresh()
+            total_revenue = ledger.total_revenue()
+            sales_df = ledger.sales_records()
+            sales_file = os.path.join(user_dir, "sales.xlsx")
+            # 銷售記錄與銷售總合由帳本重新產生；保留 sales.xlsx 中其他工作表
+            writer_kwargs = {"mode": "a", "if_sheet_exists": "replace"} if os.path.exists(sales_file) else {}
+            with pd.ExcelWriter(sales_file, engine="openpyxl", **writer_kwargs) as writer:
                 sales_df.to_excel(writer, sheet_name="銷售記錄", index=False)
                 pd.DataFrame([{"總收入": total_revenue}]).to_excel(writer, sheet_name="銷售總合", index=False)
-            QMessageBox.information(self, "更新完成", f"銷售資料已更新，總收入：{total_revenue}")
+            self.log(f"{sales_file} 已更新（重讀 {reread}/{len(sales_df)} 個訂單檔），總收入：{total_revenue}")
+            self.start_sales_sheet_sync(user_dir, sales_sheet_grid(ledger))
+            if notify:
+                QMessageBox.information(self, "更新完成", f"銷售資料已更新，總收入：{total_revenue}")
         except Exception as e:
             self.log(f"更新銷售資料時出錯：{traceback.format_exc()}")
 
-    def update_sales_file_split(self, df_pending, df_rest):
+    def update_sales_file_split(self, df_pending, df_rest, user_dir=None):
+        user_dir = user_dir or self.current_user_dir
         try:
             today = datetime.now().strftime("%Y-%m-%d")
 
@@ -1102,8 +3681,8 @@ class OrderScraperApp(QWidget):
                 "Final price": [total_final_price_rest]
             }
 
-            sales_file_pending = os.path.join(self.current_user_dir, "sales_pending.xlsx")
-            sales_file_rest = os.path.join(self.current_user_dir, "sales_rest.xlsx")
+            sales_file_pending = os.path.join(user_dir, "sales_pending.xlsx")
+            sales_file_rest = os.path.join(user_dir, "sales_rest.xlsx")
 
             if os.path.exists(sales_file_pending):
                 sales_df_pending = pd.read_excel(sales_file_pending)
@@ -1129,50 +3708,25 @@ class OrderScraperApp(QWidget):
         except Exception as e:
             self.log(f"更新銷售檔案時出錯：{traceback.format_exc()}")
 
-    def split_and_merge_orders(self, df):
+    def split_and_merge_orders(self, df, user_dir=None):
+        user_dir = user_dir or self.current_user_dir
         self.log("開始執行 split_and_merge_orders()")
-        split_rows = []
         if "Order Code" not in df.columns or "Product Info" not in df.columns:
             self.log("DataFrame 缺少必要欄位：Order Code 或 Product Info")
             return pd.DataFrame(), pd.DataFrame()
-        for idx, row in df.iterrows():
-            product_info = row["Product Info"]
-            if not isinstance(product_info, str):
-                continue
-            lines = product_info.strip().split("\n")
-            for line in lines:
-                parts = [p.strip() for p in line.split("|")]
-                if len(parts) >= 3:
-                    product_name = parts[0]
-                    attribute = parts[1].replace("；", "").strip()
-                    quantity_str = parts[2].strip()
-                    try:
-                        quantity = int(quantity_str)
-                    except ValueError:
-                        self.log(f"警告：數量無法解析，忽略此產品。訂單編號：{row['Order Code']}，產品資訊：{line}")
-                        continue
-                    split_rows.append([row["Order Code"], product_name, attribute, quantity])
-                else:
-                    self.log(f"警告：無法解析產品資訊：{line}")
-        split_df = pd.DataFrame(split_rows, columns=["Order Code", "Product Name", "Attribute", "Quantity"])
-        merged_df = split_df.groupby(["Product Name", "Attribute"], as_index=False).agg({
-            "Order Code": lambda x: ";".join(x),
-            "Quantity": "sum"
-        })
+        split_df, warnings = split_product_info(df)
+        for warning in warnings:
+            self.log(warning)
+        merged_df = merge_split_orders(split_df)
         # 新增 "Product URL" 欄位：從 products_list.xlsx 中比對 Name 欄位
         try:
-            products_file = os.path.join(self.current_user_dir, "products_list.xlsx")
-            if os.path.exists(products_file):
-                df_products = pd.read_excel(products_file)
-                if "Name" in df_products.columns and "url" in df_products.columns:
-                    def get_product_url(product_name):
-                        # 比對時使用 strip() 來避免前後空白影響比對
-                        match = df_products[df_products["Name"].str.strip().eq(product_name.strip())]
-                        if not match.empty:
-                            return match.iloc[0]["url"]
-                        else:
-                            return ""
-                    merged_df["Product URL"] = merged_df["Product Name"].apply(get_product_url)
+            catalog = product_catalogs.catalog(user_dir)
+            if catalog.refresh():
+                if catalog.url_index is not None:
+                    merged_df["Product URL"], missing = lookup_product_urls(merged_df["Product Name"],
+                                                                            catalog.url_index)
+                    if missing:
+                        self.log(f"產品目錄中找不到 {len(missing)} 項產品：{'、'.join(missing)}")
                 else:
                     self.log("產品目錄中缺少必要欄位：Name 或 url")
                     merged_df["Product URL"] = ""
@@ -1222,8 +3776,8 @@ class OrderScraperApp(QWidget):
             self.log("請先選擇使用者。")
             return
 
-        products_file = os.path.join(self.current_user_dir, "products_list.xlsx")
-        if not os.path.exists(products_file):
+        catalog = product_catalogs.catalog(self.current_user_dir)
+        if not catalog.exists():
             QMessageBox.information(self, "提示", "產品目錄不存在，開始抓取產品資料...", QMessageBox.Ok)
             self.scrape_products_data()
             return
@@ -1241,7 +3795,7 @@ class OrderScraperApp(QWidget):
             self.update_orders_url()
             '''
             print("AAAAA")
-            df_products = pd.read_excel(products_file)
+            df_products = catalog.frame()
             if df_products.shape[1] < 11 or "url" not in df_products.columns or "Unit Price" not in df_products.columns:
                 df_products["url"] = ""
                 if "進貨價" not in df_products.columns:
@@ -1249,7 +3803,7 @@ class OrderScraperApp(QWidget):
                 cols = ["#", "Thumbnail Image", "Name", "Category", "Current Qty",
                         "Base Price", "Published", "Examine Status", "Options", "url", "進貨價"]
                 df_products = df_products[cols]
-                df_products.to_excel(products_file, index=False)
+                catalog.save(df_products)
                 self.log(f"更新產品檔案欄位，補上 'url' 和 '進貨價' 欄。")
             self.update_orders_url()
         except Exception as e:
@@ -1290,20 +3844,18 @@ class OrderScraperApp(QWidget):
             self.log(f"讀取『合併後資料』工作表時出錯：{traceback.format_exc()}")
             return
 
-        products_file = os.path.join(self.current_user_dir, "products_list.xlsx")
-        if not os.path.exists(products_file):
-            self.log("產品目錄不存在，請先更新產品資料。")
-            return
-
+        catalog = product_catalogs.catalog(self.current_user_dir)
         try:
-            df_products = pd.read_excel(products_file)
+            if not catalog.refresh():
+                self.log("產品目錄不存在，請先更新產品資料。")
+                return
             self.log("已讀取產品目錄資料。")
         except Exception as e:
             self.log(f"讀取產品目錄資料時出錯：{traceback.format_exc()}")
             return
 
-        # 建立產品名稱與對應 url 的字典（假設產品目錄中欄位名稱分別為 Name 與 url）
-        product_url_map = dict(zip(df_products["Name"], df_products["url"]))
+        # 產品名稱與對應 url 的字典（假設產品目錄中欄位名稱分別為 Name 與 url）
+        product_url_map = catalog.url_map
 
         if "Product Name" not in df_order.columns:
             self.log("訂單檔『合併後資料』中無 Product Name 欄位。")
@@ -1330,73 +3882,47 @@ class OrderScraperApp(QWidget):
         dialog.exec_()
 
     def scrape_products_data(self):
-        if not self.page:
+        if not self.prepare_seller_session():
             self.log("請先啟動瀏覽器並手動登入。")
             return
 
-        try:
-            self.log("正在導航到產品頁面...")
-            self.page.goto("https://goshophsn.com/seller/products")
-            self.page.wait_for_load_state('networkidle')
-
-            all_data = []
-            while True:
-                self.page.wait_for_selector("table tbody tr", timeout=10000)
-                self.log("正在抓取當前分頁產品資料...")
-                table_rows = self.page.locator("table tbody tr")
-                for i in range(table_rows.count()):
-                    row_data = table_rows.nth(i).locator("td").all_inner_texts()
-                    cleaned_row_data = [cell.strip() for cell in row_data]
-                    all_data.append(cleaned_row_data)
-                next_button = self.page.locator("a[aria-label='Next »']")
-                if next_button.is_visible():
-                    next_button.click()
-                    self.page.wait_for_load_state('networkidle')
-                else:
-                    self.log("所有分頁抓取完畢。")
-                    break
+        self.start_scrape_task("products", scrape_products_async)
 
+    def save_scraped_products(self, result):
+        """背景抓取完成後，將產品資料存成 products_list.xlsx"""
+        all_data = result["products"]
+        try:
             if not all_data:
                 self.log("未抓取到任何產品資料。")
                 return
 
-            df_products = pd.DataFrame(all_data, columns=[
-                "#", "Thumbnail Image", "Name", "Category", "Current Qty",
-                "Base Price", "Published", "Examine Status", "Options"
-            ])
+            df_products = pd.DataFrame(all_data, columns=PRODUCT_COLUMNS)
             df_products["進貨價"] = 0.0
             # df_products["url"] = ""
 
             df_products["url"] = df_products["Name"].str.lower().str.replace(" ", "-").apply(
                 lambda x: f"https://baibaoshop.com/product/{x}")
 
-            products_file = os.path.join(self.current_user_dir, "products_list.xlsx")
-            df_products.to_excel(products_file, index=False)
-            self.log(f"產品資料已存成 Excel 檔案：{products_file}")
+            self.order_store.save_products(result["user"], df_products)
+            catalog = product_catalogs.catalog(os.path.join(self.base_dir, result["user"]))
+            catalog.save(df_products)
+            self.log(f"產品資料已存成 Excel 檔案：{catalog.products_file}")
 
             QMessageBox.information(self, "提示", "產品資料已存成 Excel 檔案,退出視窗。", QMessageBox.Ok)
         except Exception as e:
-            self.log(f"抓取產品資料時出錯：{traceback.format_exc()}")
-
-        finally:
-            if self.browser:
-                self.browser.close()
-                self.browser= None
-            if self.playwright:
-                self.playwright.stop()
-                self.playwright= None
+            self.log(f"儲存產品資料時出錯：{traceback.format_exc()}")
 
     def update_product_url(self):
         if not self.current_user_dir:
             self.log("請先選擇使用者。")
             return
 
-        products_file = os.path.join(self.current_user_dir, "products_list.xlsx")
-        if not os.path.exists(products_file):
+        catalog = product_catalogs.catalog(self.current_user_dir)
+        if not catalog.exists():
             QMessageBox.information(self, "提示", "請重建產品目錄", QMessageBox.Ok)
             return
         try:
-            dialog = UpdateProductURLDialog(products_file, self)
+            dialog = UpdateProductURLDialog(catalog, self.order_store, self)
             dialog.exec_()
         except Exception as e:
             self.log(f"更新產品URL時出錯：{traceback.format_exc()}")
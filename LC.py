@@ -8,6 +8,13 @@ from PyQt5.QtWidgets import (
 )
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from playwright.sync_api import sync_playwright
+from product_files import build_product_url_index, lookup_product_urls, product_file_key, write_product_rows
+
+# 產品連結比對：與 GPT2.py 共用 product_files 的名稱正規化與 名稱 -> url 索引
+def build_product_links(product_names, df_products):
+    urls, missing = lookup_product_urls(product_names, build_product_url_index(df_products))
+    links = urls.map(lambda url: "" if url == "" else f'=HYPERLINK("{url}", "點我")')
+    return links, missing
 
 # 新增使用者對話窗
 class AddUserDialog(QDialog):
@@ -34,7 +41,13 @@ class UpdateProductURLDialog(QDialog):
         super().__init__(parent)
         self.setWindowTitle("更新產品URL")
         self.products_file = products_file
+        # 先記下檔案版本再讀取，寫回時檔案已被其他程式改寫就拒絕儲存
+        self.file_key = product_file_key(products_file)
         self.df = pd.read_excel(products_file)
+        if "url" not in self.df.columns:
+            self.df["url"] = ""
+        self.df["url"] = self.df["url"].astype(object)
+        self.dirty_rows = set()
         self.current_index = 0
         self.initUI()
         self.load_current_record()
@@ -76,7 +89,12 @@ class UpdateProductURLDialog(QDialog):
         self.next_btn = QPushButton("下一筆")
         self.next_btn.clicked.connect(self.load_next)
         btn_layout.addWidget(self.next_btn)
+        self.write_btn = QPushButton("寫入檔案")
+        self.write_btn.clicked.connect(self.write_changes)
+        btn_layout.addWidget(self.write_btn)
         layout.addLayout(btn_layout)
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
         self.setLayout(layout)
 
     def load_current_record(self):
@@ -92,6 +110,11 @@ class UpdateProductURLDialog(QDialog):
             self.url_edit.setText(str(url))
         self.prev_btn.setEnabled(self.current_index > 0)
         self.next_btn.setEnabled(self.current_index < len(self.df) - 1)
+        self.update_status()
+
+    def update_status(self):
+        self.status_label.setText(f"未寫入檔案的修改：{len(self.dirty_rows)} 筆")
+        self.write_btn.setEnabled(bool(self.dirty_rows))
 
     def copy_name(self):
         clipboard = QApplication.clipboard()
@@ -113,13 +136,35 @@ class UpdateProductURLDialog(QDialog):
         if not self.is_valid_url(new_url):
             QMessageBox.warning(self, "錯誤", "URL 格式不正確。")
             return
-        self.df.at[self.current_index, "url"] = new_url
+        # 先記在記憶體中，按「寫入檔案」或關閉視窗時再一次寫回
+        if self.df.at[self.current_index, "url"] != new_url:
+            self.df.at[self.current_index, "url"] = new_url
+            self.dirty_rows.add(self.current_index)
+        self.update_status()
+
+    def write_changes(self):
+        if not self.dirty_rows:
+            return True
         try:
-            self.df.to_excel(self.products_file, index=False)
-            QMessageBox.information(self, "提示", "URL 已儲存。", QMessageBox.Ok)
-            print("URL 已儲存到 products_list.xlsx。")
+            write_product_rows(self.products_file, self.df, sorted(self.dirty_rows), ["url"], self.file_key)
+            self.file_key = product_file_key(self.products_file)  # 之後的寫入以這次存好的版本為準
+            print(f"{len(self.dirty_rows)} 筆 URL 已儲存到 products_list.xlsx。")
+            self.dirty_rows.clear()
+            self.update_status()
+            return True
         except Exception as e:
             QMessageBox.warning(self, "錯誤", f"儲存 URL 時出錯：{e}", QMessageBox.Ok)
+            return False
+
+    def done(self, result):
+        if self.dirty_rows:
+            reply = QMessageBox.question(self, "確認", f"有 {len(self.dirty_rows)} 筆 URL 尚未寫入檔案，是否寫入？",
+                                         QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel, QMessageBox.Yes)
+            if reply == QMessageBox.Cancel:
+                return
+            if reply == QMessageBox.Yes and not self.write_changes():
+                return
+        super().done(result)
 
     def load_prev(self):
         if self.current_index > 0:
@@ -426,20 +471,9 @@ class OrderScraperApp(QWidget):
                 df_products = pd.DataFrame(columns=["Name", "url"])
 
             # 新增 LINK 欄位
-            link_list = []
-            for idx, row in merged_df.iterrows():
-                prod_name = row["Product Name"]
-                match = df_products[df_products["Name"] == prod_name]
-                if not match.empty:
-                    url = match.iloc[0]["url"]
-                    if pd.isna(url) or url == "":
-                        link = ""
-                    else:
-                        link = f'=HYPERLINK("{url}", "點我")'
-                else:
-                    link = ""
-                link_list.append(link)
-            merged_df["LINK"] = link_list
+            merged_df["LINK"], missing = build_product_links(merged_df["Product Name"], df_products)
+            if missing:
+                self.log(f"產品目錄中找不到 {len(missing)} 項產品：{'、'.join(missing)}")
 
             # 儲存 Excel 檔案
             file_path = os.path.join(self.current_user_dir, f"goshop_orders_{datetime.now().strftime('%Y%m%d')}.xlsx")
@@ -550,20 +584,9 @@ class OrderScraperApp(QWidget):
                 df_products = pd.DataFrame(columns=["Name", "url"])
 
             # 新增 LINK 欄位
-            link_list = []
-            for idx, row in merged_df.iterrows():
-                prod_name = row["Product Name"]
-                match = df_products[df_products["Name"] == prod_name]
-                if not match.empty:
-                    url = match.iloc[0]["url"]
-                    if pd.isna(url) or url == "":
-                        link = ""
-                    else:
-                        link = f'=HYPERLINK("{url}", "點我")'
-                else:
-                    link = ""
-                link_list.append(link)
-            merged_df["LINK"] = link_list
+            merged_df["LINK"], missing = build_product_links(merged_df["Product Name"], df_products)
+            if missing:
+                self.log(f"產品目錄中找不到 {len(missing)} 項產品：{'、'.join(missing)}")
 
             # 儲存 Excel 檔案
             file_path = os.path.join(self.current_user_dir, f"goshop_orders_{start_order}_to_{end_order}.xlsx")
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+效能測試腳本（不需登入 Goshophsn，使用合成資料）
+
+用法：
+    python benchmark.py table --rows 100 --pages 20
+    python benchmark.py split --orders 100000
+    python benchmark.py lookup --products 5000 --rows 2000
+    python benchmark.py snapshot --days 30 --orders-per-day 300
+    python benchmark.py startup --runs 5 --max-ms 1500
+    python benchmark.py sheets --files 365
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from playwright.async_api import async_playwright
+
+from GPT2 import (
+    extract_table_rows, split_product_info, merge_split_orders,
+    build_product_url_index, lookup_product_urls,
+    ORDER_COLUMNS, write_order_snapshot, load_order_snapshots,
+    SalesLedger, SalesSheetSync, sales_sheet_grid,
+)
+from sheets_stub import SheetsStub
+
+
+# ===============================
+# 合成資料
+# ===============================
+def build_orders_table_html(row_count):
+    """產生與 /seller/orders 欄位相同的訂單表格 HTML"""
+    rows = []
+    for i in range(row_count):
+        product_info = "<br>".join(
+            f"Product {i}-{j} | Color {j}； | {j + 1}" for j in range(3)
+        )
+        rows.append(
+            "<tr>"
+            f"<td>{i + 1}</td>"
+            f"<td>20250315-{221502656 - i:09d}</td>"
+            "<td>3</td>"
+            f"<td>Customer {i}</td>"
+            "<td>$1,234.50</td>"
+            "<td>$12.00</td>"
+            "<td>$1,246.50</td>"
+            "<td>Pending</td>"
+            "<td>Paid</td>"
+            f"<td>{product_info}</td>"
+            "<td><a href='#'>View</a></td>"
+            "</tr>"
+        )
+    return f"<html><body><table><tbody>{''.join(rows)}</tbody></table></body></html>"
+
+
+# ===============================
+# 表格擷取：逐列 locator vs 單次 eval
+# ===============================
+async def scrape_page_per_row(page):
+    """舊版作法：每列一次 locator 往返"""
+    table_rows = page.locator("table tbody tr")
+    return [await table_rows.nth(i).locator("td").all_inner_texts() for i in range(await table_rows.count())]
+
+
+async def time_table_extraction(args):
+    """以背景抓取核心相同的 async Playwright 測量，單次 eval 即抓取時實際呼叫的 extract_table_rows"""
+    html = build_orders_table_html(args.rows)
+    async with async_playwright() as p:
+        launch_kwargs = {"headless": True}
+        if args.channel:
+            launch_kwargs["channel"] = args.channel
+        browser = await p.chromium.launch(**launch_kwargs)
+        page = await browser.new_page()
+        await page.set_content(html)
+
+        # 兩種作法結果必須一致
+        assert await scrape_page_per_row(page) == await extract_table_rows(page)
+
+        results = {}
+        for name, func in (("逐列 locator", scrape_page_per_row), ("單次 eval", extract_table_rows)):
+            timings = []
+            for _ in range(args.pages):
+                start = time.perf_counter()
+                await func(page)
+                timings.append(time.perf_counter() - start)
+            results[name] = sum(timings) / len(timings)
+        await browser.close()
+    return results
+
+
+def bench_table_extraction(args):
+    results = asyncio.run(time_table_extraction(args))
+
+    print(f"每頁 {args.rows} 列，共 {args.pages} 頁")
+    for name, avg in results.items():
+        print(f"{name:<12} 平均每頁 {avg * 1000:8.2f} ms")
+    print(f"加速倍數：{results['逐列 locator'] / results['單次 eval']:.1f}x")
+
+
+# ===============================
+# 訂單拆分與合併：iterrows vs 向量化
+# ===============================
+def build_orders_dataframe(order_count, seed=0):
+    """產生含多行 Product Info 的合成訂單，少量資料故意無法解析"""
+    rng = random.Random(seed)
+    product_info = []
+    for i in range(order_count):
+        lines = [
+            f"Product {rng.randrange(500)} | Color {rng.randrange(8)}； | {rng.randrange(1, 5)}"
+            for _ in range(rng.randint(1, 4))
+        ]
+        if i % 997 == 0:
+            lines.append("broken line")
+        if i % 1499 == 0:
+            lines.append("Product 1 | Red | x")
+        product_info.append("\n".join(lines))
+    return pd.DataFrame({
+        "Order Code": [f"20250315-{i:09d}" for i in range(order_count)],
+        "Product Info": product_info,
+    })
+
+
+def split_and_merge_iterrows(df):
+    """舊版作法：iterrows 逐筆拆解、lambda 串接訂單編號"""
+    warnings = []
+    split_rows = []
+    for idx, row in df.iterrows():
+        product_info = row["Product Info"]
+        if not isinstance(product_info, str):
+            continue
+        lines = product_info.strip().split("\n")
+        for line in lines:
+            parts = [p.strip() for p in line.split("|")]
+            if len(parts) >= 3:
+                product_name = parts[0]
+                attribute = parts[1].replace("；", "").strip()
+                quantity_str = parts[2].strip()
+                try:
+                    quantity = int(quantity_str)
+                except ValueError:
+                    warnings.append(f"警告：數量無法解析，忽略此產品。訂單編號：{row['Order Code']}，產品資訊：{line}")
+                    continue
+                split_rows.append([row["Order Code"], product_name, attribute, quantity])
+            else:
+                warnings.append(f"警告：無法解析產品資訊：{line}")
+    split_df = pd.DataFrame(split_rows, columns=["Order Code", "Product Name", "Attribute", "Quantity"])
+    merged_df = split_df.groupby(["Product Name", "Attribute"], as_index=False).agg({
+        "Order Code": lambda x: ";".join(x),
+        "Quantity": "sum"
+    })
+    return split_df, merged_df, warnings
+
+
+def split_and_merge_vectorized(df):
+    split_df, warnings = split_product_info(df)
+    return split_df, merge_split_orders(split_df), warnings
+
+
+def bench_split_and_merge(args):
+    df = build_orders_dataframe(args.orders)
+    results = {}
+    outputs = {}
+    for name, func in (("iterrows", split_and_merge_iterrows), ("向量化", split_and_merge_vectorized)):
+        start = time.perf_counter()
+        outputs[name] = func(df)
+        results[name] = time.perf_counter() - start
+
+    # 拆分、合併結果與警告必須完全相同
+    legacy, vectorized = outputs["iterrows"], outputs["向量化"]
+    pd.testing.assert_frame_equal(legacy[0], vectorized[0])
+    pd.testing.assert_frame_equal(legacy[1], vectorized[1])
+    assert legacy[2] == vectorized[2]
+
+    print(f"{args.orders} 筆訂單，拆分後 {len(vectorized[0])} 列，合併後 {len(vectorized[1])} 列，"
+          f"警告 {len(vectorized[2])} 則")
+    for name, seconds in results.items():
+        print(f"{name:<10} {seconds * 1000:10.1f} ms")
+    print(f"加速倍數：{results['iterrows'] / results['向量化']:.1f}x")
+
+
+# ===============================
+# 產品 url 比對：逐列掃描 vs 名稱索引
+# ===============================
+def lookup_urls_per_row(product_names, df_products):
+    """舊版作法：每個產品都對整個目錄 strip() 後比對"""
+    def get_product_url(product_name):
+        match = df_products[df_products["Name"].str.strip().eq(product_name.strip())]
+        if not match.empty:
+            return match.iloc[0]["url"]
+        return ""
+    return product_names.apply(get_product_url)
+
+
+def lookup_urls_indexed(product_names, df_products):
+    urls, _ = lookup_product_urls(product_names, build_product_url_index(df_products))
+    return urls
+
+
+def bench_product_lookup(args):
+    rng = random.Random(0)
+    df_products = pd.DataFrame({
+        "Name": [f" Product {i} " for i in range(args.products)],
+        "url": [f"https://baibaoshop.com/product/{i}/" for i in range(args.products)],
+    })
+    # 約一成的產品不在目錄中
+    product_names = pd.Series([f"Product {rng.randrange(int(args.products * 1.1))}" for _ in range(args.rows)])
+
+    results = {}
+    outputs = {}
+    for name, func in (("逐列掃描", lookup_urls_per_row), ("名稱索引", lookup_urls_indexed)):
+        start = time.perf_counter()
+        outputs[name] = func(product_names, df_products)
+        results[name] = time.perf_counter() - start
+
+    pd.testing.assert_series_equal(outputs["逐列掃描"], outputs["名稱索引"], check_names=False)
+
+    print(f"目錄 {args.products} 項，比對 {args.rows} 列")
+    for name, seconds in results.items():
+        print(f"{name:<10} {seconds * 1000:10.1f} ms")
+    print(f"加速倍數：{results['逐列掃描'] / results['名稱索引']:.1f}x")
+
+
+# ===============================
+# 讀取一個月訂單：Excel vs Parquet 快照
+# ===============================
+def build_daily_orders(day, order_count, rng):
+    rows = []
+    for i in range(order_count):
+        amount = round(rng.uniform(5, 80), 2)
+        service_charge = round(amount * 0.1, 2)
+        rows.append([str(i + 1), f"{day}-{221502656 - i:09d}", 1, f"Customer {i}", amount, service_charge,
+                     round(amount - service_charge, 2), "Pending", "Paid",
+                     f"Product {rng.randrange(500)} | Color {rng.randrange(8)}； | {rng.randrange(1, 5)}", ""])
+    return pd.DataFrame(rows, columns=ORDER_COLUMNS)
+
+
+def bench_order_snapshot(args):
+    rng = random.Random(0)
+    user = "bench@example.com"
+    days = [f"202503{d:02d}" for d in range(1, args.days + 1)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        snapshot_dir = os.path.join(tmp_dir, "order_snapshots")
+        excel_files = []
+        for day in days:
+            df = build_daily_orders(day, args.orders_per_day, rng)
+            file_path = os.path.join(tmp_dir, f"goshop_orders_{day}_{user}.xlsx")
+            df.to_excel(file_path, sheet_name="原始資料", index=False)
+            excel_files.append(file_path)
+            write_order_snapshot(snapshot_dir, user, df)
+
+        start = time.perf_counter()
+        df_excel = pd.concat([pd.read_excel(f, sheet_name="原始資料") for f in excel_files], ignore_index=True)
+        excel_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        df_snapshot = load_order_snapshots(snapshot_dir, user, "2025-03-01", "2025-03-31")
+        snapshot_seconds = time.perf_counter() - start
+
+    assert len(df_excel) == len(df_snapshot)
+    assert round(df_excel["Final price"].sum(), 2) == round(df_snapshot["Final price"].sum(), 2)
+
+    print(f"{args.days} 天 x 每天 {args.orders_per_day} 筆，共 {len(df_snapshot)} 筆訂單")
+    print(f"{'read_excel':<12} {excel_seconds * 1000:10.1f} ms")
+    print(f"{'Parquet 快照':<12} {snapshot_seconds * 1000:10.1f} ms")
+    print(f"加速倍數：{excel_seconds / snapshot_seconds:.1f}x")
+
+
+# ===============================
+# 啟動時間：import、建立主視窗、第一次繪製
+# ===============================
+# 每次在新的 Python 行程中量測，才包含模組冷啟動的 import 時間
+STARTUP_PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+import GPT2
+imported = time.perf_counter()
+from PyQt5.QtCore import QObject, QEvent
+from PyQt5.QtWidgets import QApplication
+
+app = QApplication(sys.argv)
+window = GPT2.OrderScraperApp()
+constructed = time.perf_counter()
+
+
+class FirstPaint(QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and obj is window:
+            painted = time.perf_counter()
+            window.removeEventFilter(self)
+            print(json.dumps({"import": imported - start, "init": constructed - imported,
+                              "paint": painted - start}), flush=True)
+            os._exit(0)  # 背景執行緒不必逐一關閉，量到即結束
+        return False
+
+
+first_paint = FirstPaint()
+window.installEventFilter(first_paint)
+window.show()
+app.exec_()
+"""
+
+
+def measure_startup(platform):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                                                      env.get("PYTHONPATH")]))
+    if platform:
+        env["QT_QPA_PLATFORM"] = platform
+    # 在空目錄啟動：沒有 users.xlsx，不會觸發 Google 登入
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        result = subprocess.run([sys.executable, "-c", STARTUP_PROBE], cwd=tmp_dir, env=env,
+                                capture_output=True, text=True, encoding="utf-8", check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def bench_startup(args):
+    runs = [measure_startup(args.platform) for _ in range(args.runs)]
+    print(f"啟動 {args.runs} 次，取中位數")
+    for key, name in (("import", "import GPT2"), ("init", "建立主視窗"), ("paint", "第一次繪製")):
+        print(f"{name:<12} {statistics.median(run[key] for run in runs) * 1000:10.1f} ms")
+    paint_ms = statistics.median(run["paint"] for run in runs) * 1000
+    if args.max_ms and paint_ms > args.max_ms:
+        print(f"第一次繪製 {paint_ms:.1f} ms 超過上限 {args.max_ms} ms")
+        sys.exit(1)
+
+
+# ===============================
+# 銷售資料同步到試算表：整張重寫 vs 差異範圍（離線替身）
+# ===============================
+def sent_cells(body):
+    return sum(len(row) for item in body["data"] for row in item["values"])
+
+
+def bench_sales_sheet(args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ledger = SalesLedger(tmp_dir)
+        ledger.entries = {
+            f"goshop_orders_2025{i:04d}_bench.xlsx": {"mtime": 0, "size": 0, "revenue": round(10 + i * 0.37, 2)}
+            for i in range(args.files)
+        }
+        stub = SheetsStub()
+        sync = SalesSheetSync(tmp_dir)
+        steps = [("第一次同步", None),
+                 ("沒有變動", None),
+                 ("新增一個訂單檔", lambda: ledger.entries.update(
+                     {"goshop_orders_29991231_bench.xlsx": {"mtime": 0, "size": 0, "revenue": 99.5}})),
+                 ("刪除一個訂單檔", lambda: ledger.entries.pop(min(ledger.entries)))]
+        for name, change in steps:
+            if change:
+                change()
+            grid = sales_sheet_grid(ledger)
+            before = len(stub.requests)
+            ranges = sync.push(stub, "bench-folder", grid)
+            updates = [body for method, body in stub.requests[before:] if method == "values_batch_update"]
+            assert stub.values(stub.files[0]["id"]) == grid
+            print(f"{name:<10} 請求 {len(stub.requests) - before} 次，範圍 {ranges} 個，"
+                  f"寫入 {sum(sent_cells(body) for body in updates)} 格（整張 {len(grid) * 2} 格）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Goshop 工具效能測試")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    table_parser = subparsers.add_parser("table", help="訂單表格擷取：逐列 locator vs 單次 eval")
+    table_parser.add_argument("--rows", type=int, default=100, help="每頁列數")
+    table_parser.add_argument("--pages", type=int, default=20, help="測試頁數")
+    table_parser.add_argument("--channel", default="", help="瀏覽器 channel，例如 msedge")
+    table_parser.set_defaults(func=bench_table_extraction)
+
+    split_parser = subparsers.add_parser("split", help="split_and_merge_orders：iterrows vs 向量化")
+    split_parser.add_argument("--orders", type=int, default=100000, help="合成訂單筆數")
+    split_parser.set_defaults(func=bench_split_and_merge)
+
+    lookup_parser = subparsers.add_parser("lookup", help="產品 url 比對：逐列掃描 vs 名稱索引")
+    lookup_parser.add_argument("--products", type=int, default=5000, help="產品目錄筆數")
+    lookup_parser.add_argument("--rows", type=int, default=2000, help="合併後資料列數")
+    lookup_parser.set_defaults(func=bench_product_lookup)
+
+    snapshot_parser = subparsers.add_parser("snapshot", help="讀取一個月訂單：Excel vs Parquet 快照")
+    snapshot_parser.add_argument("--days", type=int, default=30, help="天數（最多 31）")
+    snapshot_parser.add_argument("--orders-per-day", type=int, default=300, help="每天訂單筆數")
+    snapshot_parser.set_defaults(func=bench_order_snapshot)
+
+    startup_parser = subparsers.add_parser("startup", help="啟動時間：import、建立主視窗、第一次繪製")
+    startup_parser.add_argument("--runs", type=int, default=5, help="量測次數")
+    startup_parser.add_argument("--platform", default="", help="Qt 平台外掛，例如 offscreen（無桌面環境時使用）")
+    startup_parser.add_argument("--max-ms", type=float, default=0, help="第一次繪製超過此毫秒數時以非零狀態結束")
+    startup_parser.set_defaults(func=bench_startup)
+
+    sheets_parser = subparsers.add_parser("sheets", help="銷售資料同步到試算表：整張重寫 vs 差異範圍")
+    sheets_parser.add_argument("--files", type=int, default=365, help="帳本中的訂單檔數")
+    sheets_parser.set_defaults(func=bench_sales_sheet)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
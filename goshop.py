@@ -1,7 +1,16 @@
+import sys
 from playwright.sync_api import sync_playwright
 import pandas as pd
+from resource_blocking import is_blocked_request
 
-def scrape_orders_to_excel():
+# 快速抓取模式下丟棄圖片、影音、字型與第三方追蹤器（規則與 GPT2.py 共用）
+def block_heavy_resources(route):
+    if is_blocked_request(route.request):
+        route.abort()
+    else:
+        route.continue_()
+
+def scrape_orders_to_excel(fast_scrape=False):
     with sync_playwright() as p:
         # 開啟 Microsoft Edge 瀏覽器
         browser = p.chromium.launch(channel="msedge", headless=False)
@@ -15,6 +24,16 @@ def scrape_orders_to_excel():
         print("請在瀏覽器中手動完成登入，完成後按下 'Enter' 繼續...")
         input("等待使用者登入後按下 'Enter'：")
 
+        # 快速抓取：沿用登入狀態改以無頭模式抓取，並阻擋圖片、影音、字型與追蹤器
+        if fast_scrape:
+            storage_state = context.storage_state()
+            browser.close()
+            browser = p.chromium.launch(channel="msedge", headless=True)
+            context = browser.new_context(storage_state=storage_state)
+            context.route("**/*", block_heavy_resources)
+            page = context.new_page()
+            page.goto("https://goshophsn.com/")
+
         # 模擬點擊 "Orders" 連結
         orders_link = page.locator("text='Orders'")
         orders_link.click()
@@ -61,5 +80,5 @@ def scrape_orders_to_excel():
         input()
         browser.close()
 
-# 執行程式
-scrape_orders_to_excel()
+# 執行程式：加上 --fast 才改用快速抓取（無頭模式並阻擋非必要資源），與 GPT2.py 的「快速抓取」勾選一樣預設關閉
+scrape_orders_to_excel(fast_scrape="--fast" in sys.argv[1:])
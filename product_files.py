@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+產品目錄（products_list.xlsx）的名稱比對與存檔共用函式。
+不依賴 PyQt，GPT2.py 與 LC.py 的產品 URL 編輯器都從這裡匯入，兩邊的比對與存檔規則才不會各改各的。
+"""
+
+import os
+import tempfile
+
+import pandas as pd
+
+
+def normalize_product_names(names):
+    """比對用名稱：去除前後空白；非字串（空白儲存格、數字）一律視為無法比對"""
+    names = names.astype(object)
+    return names.where(names.map(lambda name: isinstance(name, str))).str.strip()
+
+
+def build_product_url_index(df_products):
+    """以正規化名稱建立 名稱 -> url 對照；名稱重複時以目錄中第一筆為準"""
+    names = normalize_product_names(df_products["Name"])
+    valid = names.notna()
+    url_index = pd.Series(df_products.loc[valid, "url"].to_numpy(), index=names[valid].to_numpy())
+    return url_index[~url_index.index.duplicated()]
+
+
+def lookup_product_urls(product_names, url_index):
+    """
+    一次 map 完成所有產品的 url 比對。
+    回傳 (url Series, 目錄中找不到的產品名稱清單)；找不到或 url 空白者填 ""。
+    """
+    names = normalize_product_names(product_names)
+    urls = names.map(url_index).fillna("")
+    missing = product_names[~names.isin(url_index.index)].drop_duplicates().tolist()
+    return urls, missing
+
+
+def replace_file_atomically(target_file, write):
+    """先寫入同目錄的暫存檔再取代原檔，寫到一半失敗時原檔維持不變"""
+    fd, temp_file = tempfile.mkstemp(prefix=".", suffix=os.path.splitext(target_file)[1],
+                                     dir=os.path.dirname(target_file) or ".")
+    os.close(fd)
+    try:
+        write(temp_file)
+        os.replace(temp_file, target_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+
+def product_file_key(products_file):
+    """(修改時間, 大小)，用來判斷檔案在讀取之後是否被改寫"""
+    stat = os.stat(products_file)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def write_product_rows(products_file, df_products, rows, columns, file_key):
+    """
+    只把指定列、指定欄位寫回工作表，其他儲存格不經 pandas 重建，最後以暫存檔取代原檔。
+    df_products 必須是 file_key 對應版本的內容，檔案在編輯期間被改寫時拒絕儲存，避免列位置錯開。
+    """
+    if product_file_key(products_file) != tuple(file_key):
+        raise RuntimeError(f"{os.path.basename(products_file)} 在編輯期間已被更新，請重新開啟後再修改")
+    from openpyxl import load_workbook
+    workbook = load_workbook(products_file)
+    sheet = workbook.active
+    headers = {cell.value: cell.column for cell in sheet[1] if cell.value is not None}
+    for column in columns:
+        if column not in headers:
+            headers[column] = sheet.max_column + 1
+            sheet.cell(row=1, column=headers[column], value=column)
+    for row in rows:
+        for column in columns:
+            value = df_products.iat[row, df_products.columns.get_loc(column)]
+            value = None if pd.isna(value) else getattr(value, "item", lambda: value)()
+            # 第 1 列是標題，DataFrame 第 0 列對應工作表第 2 列
+            sheet.cell(row=row + 2, column=headers[column], value=value)
+    replace_file_atomically(products_file, workbook.save)
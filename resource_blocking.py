@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+快速抓取模式共用的請求過濾規則：丟棄抓表格用不到的圖片、影音、字型與第三方追蹤器。
+不依賴 PyQt，GPT2.py 與命令列的 goshop.py 都從這裡匯入。
+"""
+
+from urllib.parse import urlparse
+
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+BLOCKED_TRACKER_HOSTS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net",
+    "facebook.net", "facebook.com", "hotjar.com", "clarity.ms",
+)
+
+
+def is_blocked_request(request):
+    """圖片、影音、字型與第三方追蹤器的請求一律丟棄"""
+    if request.resource_type in BLOCKED_RESOURCE_TYPES:
+        return True
+    host = urlparse(request.url).hostname or ""
+    return any(host == tracker or host.endswith("." + tracker) for tracker in BLOCKED_TRACKER_HOSTS)
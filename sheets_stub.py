@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+離線測試用的 Google 試算表替身，只實作 SalesSheetSync 用到的 gspread 介面：
+    client.list_spreadsheet_files(title, folder_id)
+    client.create(title, folder_id)
+    client.http_client.values_batch_update(spreadsheet_id, body)
+    client.http_client.values_batch_clear(spreadsheet_id, body)
+
+用法：
+    from GPT2 import SalesSheetSync
+    from sheets_stub import SheetsStub
+    stub = SheetsStub()
+    SalesSheetSync(user_dir).push(stub, "folder-id", grid)
+    stub.values(stub.files[0]["id"])  # 試算表目前內容
+    stub.requests                      # 每個 API 請求的記錄
+"""
+
+import re
+
+A1_RANGE_RE = re.compile(r"^([A-Z])(\d+):([A-Z])(\d*)$")
+
+
+class StubSpreadsheet:
+    def __init__(self, spreadsheet_id, title, folder_id):
+        self.id = spreadsheet_id
+        self.title = title
+        self.folder_id = folder_id
+        self.cells = {}  # (列, 欄) -> 值，皆從 0 起算
+
+
+class SheetsStub:
+    def __init__(self):
+        self.spreadsheets = {}
+        self.requests = []  # (方法, 參數)
+        self.fail_next = None  # 設為例外物件時，下一個 values_batch_update 會丟出它
+        self.http_client = self
+
+    @property
+    def files(self):
+        return [{"id": sheet.id, "name": sheet.title} for sheet in self.spreadsheets.values()]
+
+    def list_spreadsheet_files(self, title=None, folder_id=None):
+        self.requests.append(("list_spreadsheet_files", {"title": title, "folder_id": folder_id}))
+        return [
+            {"id": sheet.id, "name": sheet.title}
+            for sheet in self.spreadsheets.values()
+            if (title is None or sheet.title == title) and (folder_id is None or sheet.folder_id == folder_id)
+        ]
+
+    def create(self, title, folder_id=None):
+        self.requests.append(("create", {"title": title, "folder_id": folder_id}))
+        sheet = StubSpreadsheet(f"stub-{len(self.spreadsheets) + 1}", title, folder_id)
+        self.spreadsheets[sheet.id] = sheet
+        return sheet
+
+    def values_batch_update(self, id, body=None):
+        self.requests.append(("values_batch_update", body))
+        if self.fail_next is not None:
+            error, self.fail_next = self.fail_next, None
+            raise error
+        sheet = self.spreadsheets[id]
+        updated_cells = 0
+        for item in body["data"]:
+            start_column, start_row, end_column, end_row = A1_RANGE_RE.match(item["range"]).groups()
+            width = ord(end_column) - ord(start_column) + 1
+            height = int(end_row) - int(start_row) + 1
+            if len(item["values"]) > height or any(len(row) > width for row in item["values"]):
+                raise ValueError(f"資料超出範圍 {item['range']}")
+            for r, row in enumerate(item["values"]):
+                for c, value in enumerate(row):
+                    key = (int(start_row) - 1 + r, ord(start_column) - ord("A") + c)
+                    if value == "":
+                        sheet.cells.pop(key, None)
+                    else:
+                        sheet.cells[key] = value
+                    updated_cells += 1
+        return {"spreadsheetId": id, "totalUpdatedCells": updated_cells}
+
+    def values_batch_clear(self, id, params=None, body=None):
+        self.requests.append(("values_batch_clear", body))
+        sheet = self.spreadsheets[id]
+        for cell_range in body["ranges"]:
+            start_column, start_row, end_column, end_row = A1_RANGE_RE.match(cell_range).groups()
+            for row, column in list(sheet.cells):
+                if (row >= int(start_row) - 1 and (not end_row or row < int(end_row))
+                        and ord(start_column) - ord("A") <= column <= ord(end_column) - ord("A")):
+                    del sheet.cells[(row, column)]
+        return {"spreadsheetId": id, "clearedRanges": body["ranges"]}
+
+    def values(self, spreadsheet_id):
+        """以二維串列回傳試算表內容，尾端的空白列與空白欄會去掉"""
+        cells = self.spreadsheets[spreadsheet_id].cells
+        if not cells:
+            return []
+        rows = max(r for r, _ in cells) + 1
+        columns = max(c for _, c in cells) + 1
+        return [[cells.get((r, c), "") for c in range(columns)] for r in range(rows)]
+
+    def update_count(self):
+        return sum(1 for method, _ in self.requests if method == "values_batch_update")